@@ -18,6 +18,7 @@ Key Features:
 - Test Mode for simulation
 """
 import os
+import io
 import tkinter as tk
 from tkinter import simpledialog, messagebox, ttk
 import socket
@@ -25,16 +26,39 @@ import time
 import json
 import logging
 from pathlib import Path
-from typing import List, Dict, Any, Optional, Tuple
+from typing import List, Dict, Any, Optional, Sequence, Tuple
 import random
+import re
+import functools
+from collections import deque
 import sqlite3
+import threading
+import queue
+import selectors
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+import multiprocessing
+from dataclasses import dataclass
 from datetime import datetime, timedelta
 
+import numpy as np
 import matplotlib.pyplot as plt
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 from matplotlib.backends.backend_pdf import PdfPages
+from matplotlib.figure import Figure
 from PIL import Image, ImageTk
 
+# Certificate PDFs: maximum zlib level for the content streams, embedded TrueType (Type 42)
+# fonts instead of Type 3 glyph procedures. Agg: rasterize long paths in 10k-vertex chunks
+# (path.simplify stays at its default; traces are already min-max decimated to ~2 points per pixel)
+plt.rcParams.update({"pdf.compression": 9, "pdf.fonttype": 42, "agg.path.chunksize": 10000})
+logging.getLogger("fontTools").setLevel(logging.WARNING)   # Type 42 subsetting logs ~90 INFO lines per PDF
+
+# --- Fast JSON (optional) ---
+try:
+    import orjson  # C-accelerated encode/decode for profiles; stdlib json is used otherwise
+except ImportError:
+    orjson = None
+
 # --- Sound Alerts ---
 try:
     import beepy as beep
@@ -76,10 +100,18 @@ DEFAULT_CONFIG = {
     "test_mode_cv_current_decay": 0.05,
     "auto_reconnect": True,
     "auto_reconnect_interval_s": 5,
+    "keepalive_interval_s": 10,
     "sound_alerts": True,
     "voltage_ylim": [0, 450],
     "power_ylim": [0, 12000],
-    "live_table_points": 12
+    "live_table_points": 12,
+    "stable_dv_thresh": 0.1,
+    "slow_interval_ms": 3000,
+    "plot_points_max": 50000,
+    "db_batch_size": 50,
+    "db_flush_interval_s": 5,
+    "db_synchronous": "NORMAL",
+    "profiles_pretty_print": False
 }
 def load_config() -> Dict[str, Any]:
     """Loads configuration from JSON file, using defaults if file not found."""
@@ -92,7 +124,8 @@ def load_config() -> Dict[str, Any]:
             loaded_config = json.load(f)
             config = DEFAULT_CONFIG.copy()
             config.update(loaded_config)
-            if config != loaded_config:
+            # Only rewrite the file when defaults introduced keys it doesn't have yet
+            if DEFAULT_CONFIG.keys() - loaded_config.keys():
                  save_config(config)
             return config
     except (json.JSONDecodeError, IOError) as e:
@@ -100,10 +133,12 @@ def load_config() -> Dict[str, Any]:
         return DEFAULT_CONFIG.copy()
 
 def save_config(config: Dict[str, Any]):
-    """Saves configuration to JSON file."""
+    """Saves configuration to JSON file (atomically, via a temp file and os.replace)."""
+    tmp_file = CONFIG_FILE.with_name(CONFIG_FILE.name + ".tmp")
     try:
-        with open(CONFIG_FILE, 'w') as f:
+        with open(tmp_file, 'w') as f:
             json.dump(config, f, indent=4)
+        os.replace(tmp_file, CONFIG_FILE)
     except IOError as e:
         print(f"Error saving configuration file '{CONFIG_FILE}': {e}")
 
@@ -120,31 +155,207 @@ FUNCTION_CODE_MAP = {
     7: "DISCHARGE", 8: "CHARGE", 9: "OCP", 10: "CVD", 11: "CRD", 12: "MPPT",
     13: "CVCC", 14: "CRCC", 15: "CPCC", 16: "CVCR", 18: "CCDWAVE", 19: "SWEEP", 20: "OPP", 21: "CPD", 22: "SZ"
 }
+# Reverse lookup (name -> code), built once at import
+FUNCTION_NAME_MAP = {v: k for k, v in FUNCTION_CODE_MAP.items()}
+
+# Commands after which the load needs time to switch mode before the next message
+SLOW_SETTLE_COMMANDS = frozenset(f"INPut:FUNCtion {mode}\n".encode() for mode in ("CC", "CP", "CV"))
+SLOW_SETTLE_S = 0.05
+
+# Measurement reply: a number with an optional trailing unit, e.g. "400.12V" or "+1.5E+01 A"
+_MEAS_RE = re.compile(r"^\s*([+-]?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)\s*([A-Za-z]*)\s*$")
+
+@functools.lru_cache(maxsize=256)
+def _parse_measurement(response: Optional[str], unit: str) -> Optional[float]:
+    """Converts a SCPI measurement reply to float, accepting the expected unit (any case) or none.
+
+    Cached: steady-state replies repeat a lot, so most calls are a dict hit. An
+    unparseable reply is therefore only logged the first time it is seen.
+    """
+    if response is None: return None
+    m = _MEAS_RE.match(response)
+    if m is None or (m.group(2) and m.group(2).upper() != unit.upper()):
+        logging.warning(f"Could not parse '{response}' as float after removing '{unit}'.")
+        return None
+    return float(m.group(1))
+
+# --- Profile Steps ---
+STEP_TYPES = ("CC", "CP", "CV")
+# Step type -> (function select command, level command template)
+_STEP_CMDS = {t: (f"INPut:FUNCtion {t}", f"STATic:{t}:HIGH:LEVel {{v}}") for t in STEP_TYPES}
+_NUM_RE = re.compile(r"^\s*(?:\d+(?:\.\d*)?|\.\d+)\s*$")   # unsigned decimal, as typed in the editor
+
+@dataclass
+class ProfileStep:
+    """One discharge profile step: setpoint type/value and the condition that ends it."""
+    __slots__ = ("type", "value", "stop_condition_type", "stop_condition_value")
+    type: str                    # "CC", "CP" or "CV"
+    value: float                 # A, W or V depending on type
+    stop_condition_type: str     # "voltage" or "current"
+    stop_condition_value: float
+
+    def as_dict(self) -> Dict[str, Any]:
+        """Returns the JSON form stored in profiles.json."""
+        return {"type": self.type, "value": self.value,
+                "stop_condition_type": self.stop_condition_type, "stop_condition_value": self.stop_condition_value}
+
+    @classmethod
+    def parse(cls, type_str: str, value_str: str, stop_str: str) -> Optional["ProfileStep"]:
+        """Builds a step from editor field text; returns None unless the type is known and both numbers are positive."""
+        step_type = type_str.strip().upper()
+        if step_type not in STEP_TYPES or not _NUM_RE.match(value_str) or not _NUM_RE.match(stop_str):
+            return None
+        value, stop_value = float(value_str), float(stop_str)
+        if value <= 0 or stop_value <= 0: return None
+        return cls(step_type, value, "current" if step_type == "CV" else "voltage", stop_value)
+
+    @classmethod
+    def from_dict(cls, step: Dict[str, Any]) -> Tuple["ProfileStep", bool]:
+        """Builds a step from its JSON form, migrating old formats; returns (step, migrated)."""
+        step_type = str(step.get('type', 'CC')).upper()
+        migrated = 'stop_condition_type' not in step
+        if not migrated:
+            stop_type, stop_value = step['stop_condition_type'], step.get('stop_condition_value', 0.0)
+        elif 'stop_voltage' in step:
+            if step_type == 'CV':
+                stop_type, stop_value = 'current', 0.1
+                logging.warning(f"Migrating old CV step: Using default stop_current {stop_value}A. Please verify profile.")
+            else:
+                stop_type, stop_value = 'voltage', step['stop_voltage']
+        else:
+            stop_type, stop_value = ('current', 0.1) if step_type == 'CV' else ('voltage', 0.0)
+            logging.warning(f"Adding default stop condition for step type {step_type}")
+        return cls(step_type, float(step.get('value', 0.0)), str(stop_type).lower(), float(stop_value)), migrated
+
+
+def _format_step_label(step: ProfileStep) -> str:
+    """Concise step description for markers and reports, e.g. "CC 50A → 300V"."""
+    st = step.type
+    val = step.value
+    stop_t = step.stop_condition_type
+    stop_v = step.stop_condition_value
+    unit = "A" if st == "CC" else ("W" if st == "CP" else "V")
+    stop_unit = "A" if stop_t == "current" else "V"
+    try:
+        return f"{st} {val:g}{unit} \u2192 {stop_v:g}{stop_unit}"
+    except Exception:
+        return f"{st} {val} -> {stop_v}"
+
+
+# --- Live Sample Storage ---
+class SampleBuffer:
+    """Growable column store for live samples (time, voltage, current, power).
+
+    Each channel is a contiguous float64 row of one pre-allocated NumPy array,
+    so the plot can consume `buf.voltage` etc. as views without per-tick list
+    conversion. Capacity doubles when full, up to `max_len` (if given); past that
+    the oldest quarter is dropped. The database keeps every sample; `dropped`
+    counts how many the live view has discarded.
+    """
+    def __init__(self, capacity: int = 4096, max_len: Optional[int] = None):
+        self.max_len = max(4, int(max_len)) if max_len else None
+        if self.max_len: capacity = min(capacity, self.max_len)
+        self._data = np.empty((4, max(1, int(capacity))), dtype=np.float64)
+        self._n = 0
+        self.dropped = 0
+
+    def __len__(self) -> int:
+        return self._n
+
+    def append(self, t: float, v: float, i: float, p: float):
+        """Adds one sample, growing the backing array (or trimming the oldest samples) if needed."""
+        if self._n == self.max_len:
+            drop = self._n // 4
+            self._data[:, :self._n - drop] = self._data[:, drop:self._n]
+            self._n -= drop
+            self.dropped += drop
+        elif self._n == self._data.shape[1]:
+            size = 2 * self._n if self.max_len is None else min(2 * self._n, self.max_len)
+            grown = np.empty((4, size), dtype=np.float64)
+            grown[:, :self._n] = self._data
+            self._data = grown
+        self._data[:, self._n] = (t, v, i, p)
+        self._n += 1
+
+    def clear(self):
+        """Drops all samples but keeps the allocated storage."""
+        self._n = 0
+        self.dropped = 0
+
+    @property
+    def t(self) -> np.ndarray:
+        return self._data[0, :self._n]
+
+    @property
+    def voltage(self) -> np.ndarray:
+        return self._data[1, :self._n]
+
+    @property
+    def current(self) -> np.ndarray:
+        return self._data[2, :self._n]
+
+    @property
+    def power(self) -> np.ndarray:
+        return self._data[3, :self._n]
+
 
 # --- Database Management ---
+_INSERT_DATA_POINT_SQL = ("INSERT INTO data_points (discharge_id, timestamp, elapsed_time, voltage, current, power) "
+                          "VALUES (?, ?, ?, ?, ?, ?)")
+
 class DatabaseManager:
     """Thin SQLite wrapper for discharge sessions and sample data points."""
-    def __init__(self, db_file: Path):
-        """Initialize the class instance, set up state variables and UI elements."""
+    SYNCHRONOUS_MODES = ("OFF", "NORMAL", "FULL", "EXTRA")
+
+    def __init__(self, db_file: Path, batch_size: int = 50, flush_interval_s: float = 5.0,
+                 synchronous: str = "NORMAL"):
+        """Open the long-lived connection and create the schema if needed."""
         self.db_file = db_file
+        self.synchronous = str(synchronous).upper()
+        if self.synchronous not in self.SYNCHRONOUS_MODES:
+            logging.warning(f"Unknown db_synchronous '{synchronous}', using NORMAL.")
+            self.synchronous = "NORMAL"
+        self.batch_size = max(1, int(batch_size))
+        self.flush_interval_s = float(flush_interval_s)
+
+        # One connection for the lifetime of the app; samples are buffered and
+        # written in one transaction per batch instead of one commit per point.
+        # Batches are committed by a writer thread so the caller never waits on fsync.
+        self._lock = threading.Lock()            # guards the connection
+        self._pending_lock = threading.Lock()    # guards the sample buffer
+        self._pending: List[tuple] = []
+        self._last_flush = time.monotonic()
+        self._conn: Optional[sqlite3.Connection] = self._get_connection()
         self._create_tables()
+        self._write_queue: "queue.Queue[Optional[List[tuple]]]" = queue.Queue()
+        self._writer = threading.Thread(target=self._writer_loop, name="db-writer", daemon=True)
+        self._writer.start()
 
     def _get_connection(self) -> sqlite3.Connection:
         """Establishes and returns a database connection."""
         try:
-            conn = sqlite3.connect(self.db_file, detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES)
+            # No detect_types: numeric columns come back as plain floats and the few
+            # TIMESTAMP columns are ISO strings, parsed where a datetime is needed.
+            conn = sqlite3.connect(self.db_file, check_same_thread=False)
             conn.row_factory = sqlite3.Row
+            self._configure_pragmas(conn)
             return conn
         except sqlite3.Error as e:
             logging.error(f"Database connection error: {e}", exc_info=True)
             raise
 
+    def _configure_pragmas(self, conn: sqlite3.Connection):
+        """Switches to WAL journaling and relaxes fsync frequency for the frequent small writes."""
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(f"PRAGMA synchronous={self.synchronous}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute("PRAGMA cache_size=-8000")
+
     def _create_tables(self):
         """Creates database tables if they do not exist."""
-        conn = self._get_connection()
         try:
-            with conn:
-                conn.execute("""
+            with self._lock, self._conn:
+                self._conn.execute("""
                     CREATE TABLE IF NOT EXISTS discharges (
                         id INTEGER PRIMARY KEY AUTOINCREMENT,
                         registration_number TEXT NOT NULL,
@@ -156,7 +367,7 @@ class DatabaseManager:
                         mode TEXT
                     );
                 """)
-                conn.execute("""
+                self._conn.execute("""
                     CREATE TABLE IF NOT EXISTS data_points (
                         id INTEGER PRIMARY KEY AUTOINCREMENT,
                         discharge_id INTEGER NOT NULL,
@@ -168,91 +379,340 @@ class DatabaseManager:
                         FOREIGN KEY (discharge_id) REFERENCES discharges (id)
                     );
                 """)
+                # Report queries filter by session and sort by time: serve both from one index
+                self._conn.execute("""
+                    CREATE INDEX IF NOT EXISTS idx_data_points_discharge_elapsed
+                    ON data_points (discharge_id, elapsed_time);
+                """)
             logging.info(f"Database tables checked/created in '{self.db_file}'")
         except sqlite3.Error as e:
             logging.error(f"Database table creation failed: {e}", exc_info=True)
-        finally:
-            if conn: conn.close()
 
 
     def start_new_discharge(self, reg_num: str, profile: str, mode: str) -> int:
         """Logs the start of a new discharge and returns the session ID."""
         sql = "INSERT INTO discharges (registration_number, profile_name, start_time, mode) VALUES (?, ?, ?, ?)"
-        conn = self._get_connection()
         try:
-            with conn:
-                cur = conn.cursor()
-                cur.execute(sql, (reg_num, profile, datetime.now(), mode))
-                logging.info(f"Started new discharge in DB for {reg_num}. ID: {cur.lastrowid}")
-                return cur.lastrowid
+            with self._lock, self._conn:
+                cur = self._conn.execute(sql, (reg_num, profile, datetime.now().isoformat(" "), mode))
+            logging.info(f"Started new discharge in DB for {reg_num}. ID: {cur.lastrowid}")
+            return cur.lastrowid
         except sqlite3.Error as e:
             logging.error(f"Failed to start new discharge in DB: {e}", exc_info=True)
             play_sound("error")
             return -1
-        finally:
-            if conn: conn.close()
 
-    def log_data_point(self, discharge_id: int, elapsed: float, v: float, c: float, p: float):
-        """Logs a single data point to the database."""
+    def log_data_point(self, discharge_id: int, elapsed: float, v: float, c: float, p: float,
+                       timestamp: Optional[float] = None):
+        """Buffers a single data point; rows are written to the database in batches.
+
+        `timestamp` is the wall-clock sample time (epoch seconds) the caller already has;
+        it is only converted to the TIMESTAMP text format when the batch is written.
+        """
         if discharge_id < 0: return
-        sql = "INSERT INTO data_points (discharge_id, timestamp, elapsed_time, voltage, current, power) VALUES (?, ?, ?, ?, ?, ?)"
-        conn = self._get_connection()
-        try:
-            with conn:
-                conn.execute(sql, (discharge_id, datetime.now(), elapsed, v, c, p))
-        except sqlite3.Error as e:
-            # Avoid flooding logs if this happens repeatedly
-            logging.warning(f"Failed to log data point to DB: {e}")
-        finally:
-            if conn: conn.close()
+        if timestamp is None: timestamp = time.time()
+        self.log_data_points(((discharge_id, timestamp, elapsed, v, c, p),))
+
+    def log_data_points(self, rows: Sequence[tuple]):
+        """Buffers several (discharge_id, epoch_ts, elapsed, v, c, p) rows under one lock acquisition."""
+        batch = None
+        with self._pending_lock:
+            self._pending.extend(row for row in rows if row[0] >= 0)
+            if (len(self._pending) >= self.batch_size
+                    or time.monotonic() - self._last_flush >= self.flush_interval_s):
+                batch, self._pending = self._pending, []
+                self._last_flush = time.monotonic()
+        if batch:
+            self._write_queue.put(batch)
+
+    def flush(self, wait: bool = True):
+        """Hands all buffered data points to the writer and (by default) waits until they are committed."""
+        with self._pending_lock:
+            batch, self._pending = self._pending, []
+            self._last_flush = time.monotonic()
+        if batch:
+            self._write_queue.put(batch)
+        if wait: self._write_queue.join()
+
+    def _writer_loop(self):
+        """Background thread: commits queued batches until the None sentinel arrives."""
+        while True:
+            rows = self._write_queue.get()
+            try:
+                if rows is None: return
+                self._write_batch(rows)
+            except Exception as e:
+                # Keep the thread alive: flush()/close() join this queue and would otherwise hang
+                logging.error(f"DB writer failed on a batch of {len(rows)} data points: {e}", exc_info=True)
+            finally:
+                self._write_queue.task_done()
+
+    def _write_batch(self, rows: List[tuple]):
+        """Writes one batch of buffered data points in a single transaction."""
+        with self._lock:
+            if self._conn is None: return
+            try:
+                with self._conn:
+                    self._conn.executemany(_INSERT_DATA_POINT_SQL, (
+                        (d_id, datetime.fromtimestamp(ts).isoformat(" "), el, v, c, p)
+                        for d_id, ts, el, v, c, p in rows))
+            except sqlite3.Error as e:
+                # Avoid flooding logs if this happens repeatedly
+                logging.warning(f"Failed to log {len(rows)} data points to DB: {e}")
 
 
     def finish_discharge(self, discharge_id: int, energy: float, comment: str):
         """Updates the discharge record with end time and total energy."""
         if discharge_id < 0: return
+        self.flush()
         sql = "UPDATE discharges SET end_time = ?, total_energy_discharged = ?, discharge_comment = ? WHERE id = ?"
-        conn = self._get_connection()
         try:
-            with conn:
-                conn.execute(sql, (datetime.now(), energy, comment, discharge_id))
+            with self._lock, self._conn:
+                self._conn.execute(sql, (datetime.now().isoformat(" "), energy, comment, discharge_id))
             logging.info(f"Finished discharge in DB for ID: {discharge_id}")
         except sqlite3.Error as e:
             logging.error(f"Failed to finish discharge in DB: {e}", exc_info=True)
             play_sound("error")
-        finally:
-            if conn: conn.close()
 
-    def get_discharge_data(self, discharge_id: int) -> Tuple[Optional[List], Optional[Dict]]:
-        """Retrieves all data points and summary for a given discharge ID."""
+    def get_discharge_summary(self, discharge_id: int) -> Optional[Dict]:
+        """Retrieves only the session row (no data points) for a given discharge ID."""
+        if discharge_id < 0: return None
+        try:
+            with self._lock:
+                row = self._conn.execute("SELECT * FROM discharges WHERE id = ?", (discharge_id,)).fetchone()
+            return dict(row) if row else None
+        except sqlite3.Error as e:
+            logging.error(f"Failed to retrieve discharge summary from DB: {e}", exc_info=True)
+            return None
+
+    def get_discharge_data(self, discharge_id: int) -> Tuple[Optional[Tuple[np.ndarray, ...]], Optional[Dict]]:
+        """Retrieves all data points (as NumPy columns) and summary for a given discharge ID."""
         if discharge_id < 0: return None, None
-        
+        self.flush()
+
         info_sql = "SELECT * FROM discharges WHERE id = ?"
+        count_sql = "SELECT COUNT(*) FROM data_points WHERE discharge_id = ?"
         data_sql = "SELECT elapsed_time, voltage, current, power FROM data_points WHERE discharge_id = ? ORDER BY elapsed_time ASC"
-        
-        conn = self._get_connection()
-        try:
-            # Fetch summary info
-            info_cursor = conn.execute(info_sql, (discharge_id,))
-            summary_info_row = info_cursor.fetchone()
-            summary_info = dict(summary_info_row) if summary_info_row else None
-
-            # Fetch data points
-            data_cursor = conn.execute(data_sql, (discharge_id,))
-            rows = data_cursor.fetchall()
-            
-            elapsed_time = [row['elapsed_time'] for row in rows]
-            voltage = [row['voltage'] for row in rows]
-            current = [row['current'] for row in rows]
-            power = [row['power'] for row in rows]
 
-            return (elapsed_time, voltage, current, power), summary_info
+        try:
+            with self._lock:
+                # Fetch summary info
+                summary_info_row = self._conn.execute(info_sql, (discharge_id,)).fetchone()
+                summary_info = dict(summary_info_row) if summary_info_row else None
+
+                # Stream data points straight into one pre-sized array, in plain-tuple batches
+                n = self._conn.execute(count_sql, (discharge_id,)).fetchone()[0]
+                data = np.empty((n, 4), dtype=np.float64)
+                cur = self._conn.cursor()
+                cur.row_factory = None
+                cur.arraysize = 10000
+                cur.execute(data_sql, (discharge_id,))
+                i = 0
+                for batch in iter(cur.fetchmany, []):
+                    data[i:i + len(batch)] = batch
+                    i += len(batch)
+
+            return (data[:, 0], data[:, 1], data[:, 2], data[:, 3]), summary_info
 
         except sqlite3.Error as e:
             logging.error(f"Failed to retrieve discharge data from DB: {e}", exc_info=True)
             play_sound("error")
             return None, None
-        finally:
-            if conn: conn.close()
+
+    def close(self):
+        """Flushes pending data points, stops the writer thread and closes the connection."""
+        self.flush()
+        if self._writer.is_alive():
+            self._write_queue.put(None)
+            self._writer.join(timeout=5)
+        with self._lock:
+            if self._conn is None: return
+            try:
+                self._conn.execute("PRAGMA optimize")
+                self._conn.close()
+                logging.info("Database connection closed.")
+            except sqlite3.Error as e:
+                logging.error(f"Error closing database: {e}")
+            self._conn = None
+
+
+# --- Trace Decimation ---
+def _decimate(x: np.ndarray, y: np.ndarray, n: int = 2000) -> Tuple[np.ndarray, np.ndarray]:
+    """Min-max decimation of (x, y) to about `n` points, keeping each bucket's extremes.
+
+    Samples are split into n/2 equal buckets and each contributes its minimum and its
+    maximum in time order, so spikes and the envelope survive. The first and last
+    samples are always kept. Inputs with at most `n` points are returned unchanged.
+    """
+    size = len(x)
+    if size <= max(n, 4):
+        return x, y
+    buckets = max(1, n // 2)
+    k = size // buckets; m = buckets * k
+    yb = y[:m].reshape(buckets, k)
+    base = np.arange(0, m, k)
+    lo = base + yb.argmin(axis=1); hi = base + yb.argmax(axis=1)
+    parts = [[0], np.column_stack((np.minimum(lo, hi), np.maximum(lo, hi))).ravel()]
+    if m < size:   # leftover tail shorter than a bucket
+        tl, th = m + int(y[m:].argmin()), m + int(y[m:].argmax())
+        parts.append([min(tl, th), max(tl, th)])
+    parts.append([size - 1])
+    idx = np.concatenate(parts)
+    return x[idx], y[idx]
+
+
+# --- Certificate Rendering ---
+def _integrate_kwh(t: np.ndarray, p: np.ndarray, skip: Optional[Sequence[int]] = None) -> float:
+    """Trapezoidal energy of power samples `p` (W) over times `t` (s), in kWh.
+
+    `skip` lists sample indices i whose preceding interval (t[i-1], t[i]) is left out.
+    """
+    if len(t) < 2: return 0.0
+    dt = np.diff(t)
+    if skip is not None and len(skip):
+        idx = np.asarray(skip, dtype=np.intp)
+        dt[idx[idx > 0] - 1] = 0.0
+    return float(np.dot(dt, p[1:] + p[:-1]) / 2 / 3_600_000)
+
+def _render_certificate_worker(job: Dict[str, Any]) -> str:
+    """Renders the discharge certificate PDF described by `job` and returns its path.
+
+    Runs in a separate process (see HVBatteryDischargeApp._certificate_pool), so it
+    only uses its arguments and matplotlib's non-GUI Figure/PdfPages; no app state.
+    """
+    db_data_x, db_voltage, db_current, db_power = job["data"]
+    summary_info = job["summary_info"]
+    start_dt = datetime.fromisoformat(summary_info['start_time'])
+
+    try:
+        # Standalone Figure: not registered with pyplot or attached to the Tk canvas,
+        # so it is garbage collected with this call and never touches the GUI backend.
+        fig_report = Figure(figsize=(8.5, 11), dpi=150)
+        gs_main = fig_report.add_gridspec(2, 1, height_ratios=[5, 3.5], hspace=0.38)
+
+        ax_v_report = fig_report.add_subplot(gs_main[0])
+        ax_p_report = ax_v_report.twinx()
+
+        # The page cannot show more than ~2000 points per trace, so they are min-max decimated,
+        # then embedded as one raster image each (at the figure's 150 dpi) instead of PDF path
+        # segments; axes, ticks and text stay vector
+        line_v_rep, = ax_v_report.plot(*_decimate(db_data_x, db_voltage), label="Voltage (V)", color="blue", lw=1.6, rasterized=True)
+        line_p_rep, = ax_p_report.plot(*_decimate(db_data_x, db_power), label="Power (W)", color="red", lw=1.6, rasterized=True)
+
+        ax_v_report.set_xlabel("Time (s)", fontsize=12)
+        ax_v_report.set_ylabel("Voltage (V)", color="blue", fontsize=12)
+        ax_p_report.set_ylabel("Power (W)", color="red", fontsize=12)
+        ax_v_report.tick_params(axis='y', labelcolor='blue', labelsize=11)
+        ax_p_report.tick_params(axis='y', labelcolor='red', labelsize=11)
+        ax_v_report.grid(True, linestyle=':', alpha=0.6)
+        report_title = f"HV Battery Discharge Report - {summary_info['registration_number']}" + (" (TEST MODE)" if summary_info.get('mode') == "Test" else "")
+        ax_v_report.set_title(report_title, fontsize=14, pad=14)
+
+        ax_v_report.legend(handles=[line_v_rep, line_p_rep], loc='upper right', fontsize='small', frameon=True)
+
+        ax_summary = fig_report.add_subplot(gs_main[1])
+        ax_summary.axis("off")
+        duration = db_data_x[-1] if len(db_data_x) else 0
+        start_v = db_voltage[0] if len(db_voltage) else 0
+        end_v = db_voltage[-1] if len(db_voltage) else 0
+        duration_fmt = str(timedelta(seconds=int(duration)))
+        
+        parts = [f"Profile: {job['profile_name']}\nSteps:\n"]
+        if job["step_labels"]:
+            parts.extend(f"  {i+1}) {label}\n" for i, label in enumerate(job["step_labels"]))
+        else:
+            parts.append("  (No steps defined)\n")
+        profile_details_str = "".join(parts)
+        comment_str = f"\nComments: {summary_info.get('discharge_comment', '')}" if summary_info.get('discharge_comment') else ""
+        
+
+        # Compute basic stats (vectorized over the DB columns)
+        try:
+            if len(db_voltage):
+                v_min, v_max, v_avg = float(db_voltage.min()), float(db_voltage.max()), float(db_voltage.mean())
+                p_min, p_max, p_avg = float(db_power.min()), float(db_power.max()), float(db_power.mean())
+                i_min, i_max, i_avg = float(db_current.min()), float(db_current.max()), float(db_current.mean())
+            else:
+                v_min=v_max=v_avg=p_min=p_max=p_avg=i_min=i_max=i_avg=0.0
+        except Exception:
+            v_min=v_max=v_avg=p_min=p_max=p_avg=i_min=i_max=i_avg=0.0
+        # Energy integrated live is authoritative; integrate the samples if the session has none
+        energy_kwh = summary_info.get('total_energy_discharged')
+        if energy_kwh is None:
+            energy_kwh = _integrate_kwh(db_data_x, db_power)
+
+        idn_line = job["idn"] or "(no IDN)"
+        lines = [
+            f"Registration Number: {summary_info['registration_number']}",
+            f"Date: {start_dt.strftime('%Y-%m-%d %H:%M:%S')}",
+            f"Mode: {summary_info.get('mode', 'N/A')}",
+            f"Instrument: {idn_line}",
+            f"Operator: {job['operator'] or '-'}",
+            f"Location: {job['location'] or '-'}",
+            "",
+            profile_details_str,
+            f"Starting Voltage: {start_v:.2f} V",
+            f"Ending Voltage: {end_v:.2f} V",
+            f"Total Discharge Duration: {duration_fmt} ({duration:.2f} s)",
+            f"Total Energy Discharged: {energy_kwh:.3f} kWh{comment_str}",
+            "",
+            f"Stats (V): min {v_min:.2f}, avg {v_avg:.2f}, max {v_max:.2f}",
+            f"Stats (A): min {i_min:.2f}, avg {i_avg:.2f}, max {i_max:.2f}",
+            f"Stats (W): min {p_min:.2f}, avg {p_avg:.2f}, max {p_max:.2f}",
+        ]
+
+        # Append step timeline table
+        try:
+            if job["step_timeline"]:
+                def _fmt(t):
+                    h, rem = divmod(int(max(0, t or 0)), 3600); m, s = divmod(rem, 60)
+                    return f"{h:02d}:{m:02d}:{s:02d}"
+                rows = []
+                for row in job["step_timeline"]:
+                    s = row.get("start_s", 0.0) or 0.0
+                    e = row.get("end_s", s) or 0.0
+                    rows.append(f"{row.get('idx', '?'):>2}) {_fmt(s)} → {_fmt(e)}  (Δ {_fmt(max(0.0, e - s))})  — {row.get('label', '')}")
+                if rows:
+                    lines += ["", "Step timeline:", *rows]
+        except Exception:
+            pass
+        summary_text = "\n".join(lines)
+
+        ax_summary.text(0.03, 0.97, summary_text, fontsize=9.7, va="top", ha="left", linespacing=1.44, wrap=True)
+
+        logo_files = [name for name, _ in job["logos"]]
+        valid_logos = [img for _, img in job["logos"]]
+
+        if valid_logos:
+            logo_area_bottom = 0.015; logo_area_height = 0.07
+            logo_area_left = 0.12; logo_area_width = 0.76
+            min_spacing_fig = 0.014
+            aspects = np.array([img.shape[1] / img.shape[0] if img.shape[0] > 0 else 1 for img in valid_logos], dtype=float)
+            widths = logo_area_height * aspects
+            required_width_fig = widths.sum() + min_spacing_fig * (len(widths) - 1)
+            # Shrink the whole row (logos and gaps alike) when it is wider than the area
+            scale_factor = min(1.0, logo_area_width / required_width_fig)
+            widths *= scale_factor
+            start_x_fig = max(logo_area_left, logo_area_left + (logo_area_width - required_width_fig * scale_factor) / 2)
+            # Left edge of each logo: start plus the widths and gaps of all logos before it
+            xs = start_x_fig + np.concatenate(([0.0], np.cumsum(widths + min_spacing_fig * scale_factor)[:-1]))
+            fit = int(np.searchsorted(xs + widths, logo_area_left + logo_area_width + 0.01, side="right"))
+            logo_height_fig_scaled = logo_area_height * scale_factor
+            for x, w, img in zip(xs[:fit], widths[:fit], valid_logos):
+                img_ax = fig_report.add_axes([x, logo_area_bottom, w, logo_height_fig_scaled])
+                img_ax.imshow(img); img_ax.axis("off")
+            if fit < len(valid_logos):
+                logging.warning(f"Could not fit logo '{logo_files[fit]}' in certificate space.")
+
+        fig_report.subplots_adjust(left=0.10, right=0.92, top=0.95, bottom=0.20, hspace=0.39)
+        ax_p_report.set_ylabel("Power (W)", color="red", fontsize=12, labelpad=18)
+
+        with PdfPages(job["output_path"]) as pdf_object:
+            pdf_object.savefig(fig_report, dpi=150)
+        return job["output_path"]
+
+    except Exception as e:
+        raise RuntimeError(f"Error during PDF generation: {e}") from e
 
 
 # --- Main Application Class ---
@@ -266,11 +726,35 @@ class HVBatteryDischargeApp:
         self.master.geometry("1024x768")
 
         self.test_mode = tk.BooleanVar(value=False)
+        # Plain-attribute mirror of test_mode, so hot paths don't cross into Tcl for every read
+        self._test_mode_cached: bool = False
+        self.test_mode.trace_add("write", lambda *_: setattr(self, "_test_mode_cached", self.test_mode.get()))
 
         # Communication Attributes
         self.ip: str = self.config['ip_address']
         self.port: int = self.config['port']
         self.buffer_size: int = self.config['buffer_size']
+        # Encoded bytes of commands already sent, keyed by the command string
+        self._cmd_bytes_cache: Dict[str, bytes] = {}
+        # Socket I/O runs on a per-connection thread fed by _io_requests (see _io_loop)
+        self._io_thread: Optional[threading.Thread] = None
+        self._io_requests: "queue.SimpleQueue" = queue.SimpleQueue()
+        self._io_errors: "queue.SimpleQueue" = queue.SimpleQueue()
+        self._io_error_job = None
+        self._last_io_ts: float = time.monotonic()
+        self._query_timeouts: int = 0
+        self._keepalive_job = None
+        self._compound_meas_ok: bool = True
+        self._last_known_func: Optional[str] = None   # last INPut:FUNCtion sent or read back
+        self._query_cache: Dict[str, Tuple[float, str]] = {}   # query -> (monotonic ts, reply), see scpi_query_cached
+        self._step_cache: List[Dict[str, Any]] = []   # per-step strings/commands for the running profile
+        # Acquisition thread state (real instrument only; see _acq_worker)
+        self._acq_thread: Optional[threading.Thread] = None
+        self._acq_stop = threading.Event()
+        self._acq_queue: "queue.Queue" = queue.Queue(maxsize=self.ACQ_QUEUE_MAX)
+        self._drain_job = None
+        self._sample_interval_s: float = self.SAMPLE_INTERVAL_S
+        self._cert_executor: Optional[ProcessPoolExecutor] = None   # started on the first certificate
         self.socket_timeout: int = 5
         self.s: Optional[socket.socket] = None
         self.connected: bool = False
@@ -286,7 +770,7 @@ class HVBatteryDischargeApp:
         # State Attributes
         self.running: bool = False
         self.paused: bool = False
-        self.current_profile_data: List[Dict[str, Any]] = []
+        self.current_profile_data: List[ProfileStep] = []
         self.current_profile_name: str = ""
         self.current_step: int = 0
         self.registration_number: str = ""
@@ -295,12 +779,17 @@ class HVBatteryDischargeApp:
 
         # Data Attributes
         self.energy_discharged: float = 0.0
+        # Run clock: time.monotonic() values, so NTP/DST wall-clock jumps cannot skew elapsed time or energy
         self.start_time: Optional[float] = None
         self.last_time: Optional[float] = None
-        self.data_x: List[float] = []
-        self.data_voltage: List[float] = []
-        self.data_current: List[float] = []
-        self.data_power: List[float] = []
+        # Samples whose interval the live sum did not take sample-to-sample (rejected gap, or
+        # started at a resume), and the live energy of the latter; see stop_discharge
+        self._energy_skip: List[int] = []
+        self._energy_partial_kwh: float = 0.0
+        self._prev_sample_time: Optional[float] = None
+        # Allocated once at full size (4 x 8 B per sample): no growth copies during a run
+        points_max = int(self.config.get("plot_points_max", 50000))
+        self.samples = SampleBuffer(capacity=points_max, max_len=points_max)
 
         # Plot markers for step changes
         self.step_markers: List[tuple] = []
@@ -308,8 +797,13 @@ class HVBatteryDischargeApp:
         # File/Directory Paths
         self.report_dir = Path(self.config['report_directory'])
         self.profiles_file = Path(self.config['profiles_file'])
+        self._profiles_dirty: bool = False
+        self._profiles_save_job = None
         self.logo_dir = Path(self.config['logo_directory'])
-        self.db_manager = DatabaseManager(Path(self.config['database_file']))
+        self.db_manager = DatabaseManager(Path(self.config['database_file']),
+                                          batch_size=self.config.get('db_batch_size', 50),
+                                          flush_interval_s=self.config.get('db_flush_interval_s', 5),
+                                          synchronous=self.config.get('db_synchronous', "NORMAL"))
 
         # Simulation State
         self.sim_voltage: float = self.config.get('test_mode_initial_voltage', 400.0)
@@ -317,10 +811,18 @@ class HVBatteryDischargeApp:
         self.sim_power: float = 0.0
         self.sim_resistance_factor: float = self.config.get('test_mode_resistance_factor', 0.01)
         self.sim_cv_current: float = self.config.get('test_mode_cv_current_start', 5.0)
+        self._sim_cv_keep: float = 1 - self.config.get('test_mode_cv_current_decay', 0.05)   # per-tick CV current factor
+        # Precomputed block of upcoming simulated samples (see _simulate_block)
+        self._sim_block: Optional[Dict[str, Any]] = None
+        self._sim_rng = np.random.default_rng()
 
         self.report_dir.mkdir(exist_ok=True)
 
-        self.profiles: Dict[str, List[Dict[str, Any]]] = {}
+        self.profiles: Dict[str, List[ProfileStep]] = {}
+        self._plot_job = None
+        self._status_widget_cache: Dict[int, Dict[str, Any]] = {}
+        self._last_btn_state: Dict[Any, str] = {}
+        self._last_btn_inputs: Optional[tuple] = None
 
         self._setup_ui()
 
@@ -332,7 +834,7 @@ class HVBatteryDischargeApp:
         self.master.bind("<p>", lambda e: self.toggle_pause_discharge())
         self.master.bind("<e>", lambda e: self.confirm_stop_discharge())
         # self.master.bind("<space>", lambda e: self.confirm_stop_discharge())
-        if self.test_mode.get():
+        if self._test_mode_cached:
             self.toggle_test_mode()
         else:
             self.connect_instrument()
@@ -340,7 +842,7 @@ class HVBatteryDischargeApp:
         self.load_profiles()
 
         self.master.protocol("WM_DELETE_WINDOW", self.on_closing)
-        self.update_measurement_display()
+        if self._test_mode_cached: self.update_measurement_display(self.sim_voltage, self.sim_current, self.sim_power)
         self.update_button_states()
         try:
             self._update_title_with_idn("")
@@ -364,6 +866,8 @@ class HVBatteryDischargeApp:
         # Instrument ID label (populated on connect)
         self.idn_label = tk.Label(top_bar_frame, text="", fg="#333", font=("Helvetica", 9))
         self.idn_label.pack(side="left", padx=(12,0))
+        self.report_status_label = tk.Label(top_bar_frame, text="", fg="#333", font=("Helvetica", 9))
+        self.report_status_label.pack(side="left", padx=(12,0))
 
         # Compact live status panel
         status_box = tk.Frame(top_bar_frame)
@@ -405,8 +909,8 @@ class HVBatteryDischargeApp:
         toolbar.pack(side="top", anchor="w", padx=5, pady=(0,3))
         self.auto_v = tk.BooleanVar(value=True)
         self.auto_p = tk.BooleanVar(value=True)
-        tk.Checkbutton(toolbar, text="Auto V", variable=self.auto_v, command=self.update_plot).pack(side="left")
-        tk.Checkbutton(toolbar, text="Auto P", variable=self.auto_p, command=self.update_plot).pack(side="left")
+        tk.Checkbutton(toolbar, text="Auto V", variable=self.auto_v, command=lambda: self.update_plot(full=True)).pack(side="left")
+        tk.Checkbutton(toolbar, text="Auto P", variable=self.auto_p, command=lambda: self.update_plot(full=True)).pack(side="left")
         self.bottom_frame = tk.Frame(self.master)
         self.bottom_frame.pack(fill="x", padx=5, pady=5)
 
@@ -427,10 +931,33 @@ class HVBatteryDischargeApp:
         """Sets up the Matplotlib graph for Voltage and Power."""
         self.fig, self.ax_voltage = plt.subplots(figsize=(8, 4))
         self.ax_power = self.ax_voltage.twinx()
+        self.ax_voltage.set_xlabel("Time (s)"); self.ax_voltage.set_ylabel("Voltage (V)", color="blue")
+        self.ax_power.set_ylabel("Power (W)", color="red")
+        self.ax_voltage.tick_params(axis='y', labelcolor='blue'); self.ax_power.tick_params(axis='y', labelcolor='red')
+        self.ax_voltage.grid(True, axis='y', linestyle=':')
+
+        # Traces are persistent animated artists: a normal tick only restores the
+        # cached background and re-blits them; the full figure is re-rendered only
+        # when limits, markers or the window size change.
+        self.line_v, = self.ax_voltage.plot([], [], label="Voltage (V)", color="blue", lw=1.5, animated=True)
+        self.line_p, = self.ax_power.plot([], [], label="Power (W)", color="red", lw=1.5, animated=True)
+        self.plot_legend = self.ax_voltage.legend(handles=[self.line_v, self.line_p], loc='upper right')
+        self.plot_legend.set_visible(False)
+        self._marker_artists: Dict[tuple, Tuple[Any, Any]] = {}   # marker -> (vline, text)
+        self._markers_drawn = 0
+        self._plotted_n = 0
+        self._plot_bg = None
+
         self.canvas = FigureCanvasTkAgg(self.fig, master=self.graph_frame)
+        self.canvas.mpl_connect("draw_event", self._on_canvas_draw)
         self.canvas_widget = self.canvas.get_tk_widget()
         self.canvas_widget.pack(fill="both", expand=True)
-        self.fig.tight_layout()
+        self._plot_hidden_stale = False
+        self.canvas_widget.bind("<Map>", self._on_graph_mapped, add="+")
+        try:
+            self.fig.set_layout_engine('constrained')
+        except Exception:
+            self.fig.tight_layout()
 
     def _setup_profile_ui(self):
         """Sets up profile selection and management UI."""
@@ -438,6 +965,8 @@ class HVBatteryDischargeApp:
         self.profile_label.grid(row=0, column=0, padx=5, pady=5, sticky="w")
 
         self.profile_var = tk.StringVar()
+        self._profile_name_cached: str = ""
+        self.profile_var.trace_add("write", lambda *_: setattr(self, "_profile_name_cached", self.profile_var.get()))
         self.profile_dropdown = ttk.Combobox(self.profile_frame, textvariable=self.profile_var, state="readonly")
         self.profile_dropdown.grid(row=1, column=0, padx=5, pady=2, sticky="ew")
 
@@ -542,6 +1071,30 @@ class HVBatteryDischargeApp:
 
         return img
 
+    def _load_prepared_logo(self, logo_path: Path) -> Image.Image:
+        """Return the logo flattened onto white as RGB."""
+        img = Image.open(logo_path)
+        # Normalize palette+transparency and flatten onto white
+        if (img.mode == "P" and "transparency" in getattr(img, "info", {})) or img.mode in ("RGBA", "LA"):
+            img = img.convert("RGBA")
+            # Many logos carry an alpha channel that is opaque everywhere; just drop it
+            if img.getchannel("A").getextrema()[0] < 255:
+                _bg = Image.new("RGBA", img.size, (255, 255, 255, 255))
+                img = Image.alpha_composite(_bg, img)
+        return img.convert("RGB")
+
+    def _certificate_logo(self, filename: str) -> Optional[np.ndarray]:
+        """Full-resolution cleaned logo as an RGB array, kept in memory after the first load."""
+        img = self._logo_cache.get(filename)
+        if img is None:
+            logo_path = self.logo_dir / filename
+            if not logo_path.is_file(): return None
+            try:
+                img = self._logo_cache[filename] = np.asarray(self._load_prepared_logo(logo_path), dtype=np.uint8)
+            except Exception as e:
+                logging.warning(f"Logo load error: {e}"); return None
+        return img
+
     def _setup_logos(self):
         """Load, clean, and resize logo images for use in UI and PDF."""
         """Loads and displays logos."""
@@ -549,6 +1102,7 @@ class HVBatteryDischargeApp:
         self.logo_frame.pack(pady=10, side="bottom", fill="x", anchor="center")
 
         self.logo_images = []
+        self._logo_cache: Dict[str, np.ndarray] = {}   # filename -> cleaned uint8 RGB array for certificates
         logo_files = self.config.get('logo_filenames', [])
         if not logo_files:
              logging.warning("No logo filenames found in config.")
@@ -566,15 +1120,11 @@ class HVBatteryDischargeApp:
             try:
                 logo_path = self.logo_dir / filename
                 if logo_path.is_file():
-                    logo_image = Image.open(logo_path)
-                    # Normalize palette+transparency and flatten onto white
-                    if logo_image.mode == "P" and "transparency" in getattr(logo_image, "info", {}):
-                        logo_image = logo_image.convert("RGBA")
-                    if logo_image.mode in ("RGBA", "LA"):
-                        logo_image = logo_image.convert("RGBA")
-                        _bg = Image.new("RGBA", logo_image.size, (255, 255, 255, 255))
-                        logo_image = Image.alpha_composite(_bg, logo_image).convert("RGB")
-                    logo_image = logo_image.resize(logo_size, Image.Resampling.LANCZOS)
+                    logo_image = self._load_prepared_logo(logo_path)
+                    self._logo_cache[filename] = np.asarray(logo_image, dtype=np.uint8)   # before the in-place thumbnail
+                    # Cheap in-place 2x-oversized reduction first; Lanczos is wasted at 80 px
+                    logo_image.thumbnail((logo_size[0] * 2, logo_size[1] * 2), Image.Resampling.BILINEAR)
+                    logo_image = logo_image.resize(logo_size, Image.Resampling.BILINEAR)
                     logo_photo = ImageTk.PhotoImage(logo_image)
                     self.logo_images.append(logo_photo)
 
@@ -627,6 +1177,10 @@ class HVBatteryDischargeApp:
             self.live_tbl.heading(col, text=col)
             self.live_tbl.column(col, width=w, anchor="center")
         self.live_tbl.pack(side="left", padx=5, pady=5)
+        # Formatted rows are the source of truth; the Treeview mirrors them only while it is on screen
+        self._live_rows: deque = deque(maxlen=max(1, int(self.config.get("live_table_points", 12))))
+        self._live_tbl_stale = False
+        self.live_tbl.bind("<Map>", lambda e: self._refresh_live_tbl())
         btns = tk.Frame(tbl_frame); btns.pack(side="left", fill="y", padx=5)
         tk.Button(btns, text="Copy", command=self._copy_live_table).pack(pady=5)
 
@@ -647,10 +1201,10 @@ class HVBatteryDischargeApp:
         if self.running:
             messagebox.showwarning("Mode Change Denied", "Cannot change mode while discharge is running.")
             play_sound("warning")
-            self.test_mode.set(not self.test_mode.get())
+            self.test_mode.set(not self._test_mode_cached)
             return
 
-        is_test = self.test_mode.get()
+        is_test = self._test_mode_cached
         logging.info(f"Toggling Test Mode to: {is_test}")
 
         if is_test:
@@ -664,15 +1218,15 @@ class HVBatteryDischargeApp:
         else:
             self.connected = False
             self.status_label.config(text="Disconnected", fg="red")
-            self.connect_instrument()
-            self.update_measurement_display()
+            # A successful connect shows its first reading itself
+            if not self.connect_instrument(): self.update_measurement_display(0.0, 0.0, 0.0)
 
         self.update_button_states()
 
     def connect_instrument(self):
         """Connect to the instrument via TCP and query *IDN? for identification."""
         """Attempts to connect to the real instrument (if not in test mode)."""
-        if self.test_mode.get():
+        if self._test_mode_cached:
              logging.info("In Test Mode, skipping real connection.")
              self.connected = True
              self.status_label.config(text="Connected (TEST MODE)", fg="orange")
@@ -681,17 +1235,34 @@ class HVBatteryDischargeApp:
         if self.connected and self.s: return True
         try:
             self.s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            # SCPI is small request/response traffic: disable Nagle so queries are not
+            # held back waiting for an ACK, and let TCP keepalive detect half-open links.
+            self.s.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.s.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
             self.s.settimeout(self.socket_timeout)
             self.s.connect((self.ip, self.port))
             self.connected = True
+            self._query_timeouts = 0
+            self._compound_meas_ok = True
+            self._last_known_func = None
+            self._query_cache.clear()
+            self._reconnect_attempts = 0
+            self._start_io_thread()
             self.status_label.config(text="Connected", fg="green")
             logging.info(f"Successfully connected to {self.ip}:{self.port}")
             self.update_button_states()
             self._cancel_reconnect()
             try:
-                idn = self.scpi_query("*IDN?")
+                # Identify and take the first reading in one round trip
+                fields = self.scpi_query_multi(["*IDN?", *self.MEAS_QUERIES])
+                idn = fields[0] if fields else self.scpi_query("*IDN?")
                 if idn:
+                    self._query_cache["*IDN?"] = (time.monotonic(), idn)
                     self._update_title_with_idn(idn)
+                if fields:
+                    v, c, p = (_parse_measurement(f, u) for f, u in zip(fields[1:], ("V", "A", "W")))
+                    if v is not None and c is not None and p is not None:
+                        self.update_measurement_display(v, c, p)
             except Exception:
                 pass
             try:
@@ -701,6 +1272,7 @@ class HVBatteryDischargeApp:
                 self._status_job = self.master.after(100, self._status_poll_tick)
             except Exception:
                 pass
+            self._schedule_keepalive()
             return True
         except (socket.error, socket.timeout) as e:
             self.connected = False
@@ -721,7 +1293,7 @@ class HVBatteryDischargeApp:
     def disconnect_instrument(self):
         """Disconnect from the instrument and update UI state."""
         """Disconnects from the real instrument safely."""
-        if self.test_mode.get():
+        if self._test_mode_cached:
              logging.info("In Test Mode, no real instrument to disconnect.")
              self.connected = False
              self.status_label.config(text="Disconnected", fg="red")
@@ -730,6 +1302,7 @@ class HVBatteryDischargeApp:
         if self.s:
             try:
                 if self.connected: self.scpi_command("INPut:STATe 0")
+                self._stop_io_thread(wait=True)
                 self.s.close()
                 logging.info("Socket closed.")
             except (socket.error, AttributeError) as e:
@@ -742,45 +1315,40 @@ class HVBatteryDischargeApp:
 
 
     def scpi_command(self, command: str) -> bool:
-        """Send a SCPI command to the instrument (no response expected)."""
-        """Sends an SCPI command to the instrument (bypassed in test mode)."""
-        if self.test_mode.get():
-            logging.info(f"TEST MODE: Bypassed SCPI command: {command}")
+        """Queues a SCPI command for the I/O thread (no response expected; bypassed in test mode).
+
+        Returns False only when there is no connection to queue it on. A failed send is
+        reported later on the Tk thread by _check_io_errors, which handles the connection loss.
+        """
+        if self._test_mode_cached:
+            logging.info("TEST MODE: Bypassed SCPI command: %s", command)
             return True
 
         if not self.connected or not self.s:
             logging.warning(f"Not connected. Cannot send command: {command}")
             return False
-        try:
-            command_bytes = (command.strip() + '\n').encode()
-            self.s.sendall(command_bytes)
-            logging.debug(f"Sent: {command}")
-            if "FUNCtion" in command: time.sleep(0.05)
-            return True
-        except (socket.error, socket.timeout, BrokenPipeError) as e:
-            logging.error(f"Socket error sending command '{command}': {e}")
-            messagebox.showerror("Communication Error", f"Failed command: {command}\nError: {e}\nCheck connection.")
-            play_sound("error")
-            self.handle_connection_loss()
-            return False
-        except AttributeError:
-             logging.error("Socket object not available for sending command.")
-             self.handle_connection_loss()
-             return False
+        # Fire-and-forget: the I/O thread sends it in order; send failures are
+        # reported back to the Tk thread by _check_io_errors.
+        self._io_requests.put((self._encode_command(command), None))
+        self._last_io_ts = time.monotonic()
+        if self._query_cache:   # a write to a setting invalidates its cached query, e.g. INPut:STATe -> INPut:STATe?
+            self._query_cache.pop(command.split(" ", 1)[0] + "?", None)
+        logging.debug("Queued: %s", command)
+        return True
 
 
     def scpi_query(self, query: str) -> Optional[str]:
         """Send a SCPI query to the instrument and return the string response."""
         """Sends an SCPI query and returns the response (bypassed in test mode)."""
-        if self.test_mode.get() and query.startswith("MEAS"):
+        if self._test_mode_cached and query.startswith("MEAS"):
             logging.warning(f"TEST MODE: SCPI Query '{query}' called directly but should be handled by fetch_measurements simulation.")
             if "VOLT" in query: return f"{self.sim_voltage:.3f} V"
             if "CURR" in query: return f"{self.sim_current:.3f} A"
             if "POW" in query: return f"{self.sim_power:.3f} W"
             return "TEST_MODE_DUMMY"
 
-        if self.test_mode.get():
-            logging.info(f"TEST MODE: Bypassed SCPI query: {query}")
+        if self._test_mode_cached:
+            logging.info("TEST MODE: Bypassed SCPI query: %s", query)
             if query == "*IDN?": return "Simulated Instrument, Model Test, S/N 12345"
             return "TEST_MODE_OK"
 
@@ -788,33 +1356,208 @@ class HVBatteryDischargeApp:
             logging.warning(f"Not connected. Cannot send query: {query}")
             return None
         try:
-            query_bytes = (query.strip() + '\n').encode()
-            self.s.sendall(query_bytes)
-            logging.debug(f"Sent query: {query}")
-            response = self.s.recv(self.buffer_size).decode().strip()
-            logging.debug(f"Received: {response}")
-            if "error" in response.lower() or "invalid" in response.lower():
-                 logging.warning(f"Instrument query '{query}' returned error state: {response}")
-            return response
-        except (socket.error, socket.timeout, BrokenPipeError) as e:
-            logging.error(f"Socket error during query '{query}': {e}")
-            messagebox.showerror("Communication Error", f"Failed query: {query}\nError: {e}\nCheck connection.")
-            play_sound("error")
-            self.handle_connection_loss()
-            return None
-        except AttributeError:
-            logging.error("Socket object not available for querying.")
-            self.handle_connection_loss()
+            return self._io_query(query)
+        except (socket.error, BrokenPipeError, FutureTimeoutError) as e:
+            self._handle_query_error(query, e)
             return None
 
+    def _io_query(self, query: str) -> str:
+        """Sends a query through the I/O thread and waits for its reply; raises on timeouts and socket errors.
+
+        Safe to call from any thread (it touches no Tk state).
+        """
+        future: Future = Future()
+        self._io_requests.put((self._encode_command(query), future))
+        debug = logging.debug
+        debug("Sent query: %s", query)
+        self._last_io_ts = time.monotonic()
+        response = future.result(timeout=self.socket_timeout + 1)
+        self._query_timeouts = 0
+        debug("Received: %s", response)
+        low = response.lower()
+        if "error" in low or "invalid" in low:
+             logging.warning(f"Instrument query '{query}' returned error state: {response}")
+        return response
+
+    def _handle_query_error(self, query: str, e: Exception):
+        """Tk-thread handling of a failed query: count timeouts, tear down on hard errors."""
+        if isinstance(e, (socket.timeout, FutureTimeoutError)):
+            # A slow reply is not a dead link: keep the socket and only reconnect
+            # after several timeouts in a row.
+            self._query_timeouts += 1
+            logging.warning(f"Timeout on query '{query}' ({self._query_timeouts} in a row): {e}")
+            if self._query_timeouts >= self.MAX_QUERY_TIMEOUTS:
+                messagebox.showerror("Communication Error", f"Instrument stopped responding.\nLast query: {query}\nCheck connection.")
+                play_sound("error")
+                self.handle_connection_loss()
+            return
+        logging.error(f"Socket error during query '{query}': {e}")
+        messagebox.showerror("Communication Error", f"Failed query: {query}\nError: {e}\nCheck connection.")
+        play_sound("error")
+        self.handle_connection_loss()
+
+
+    MAX_QUERY_TIMEOUTS = 3
+
+    # Replies that cannot change faster than this (seconds); matching writes invalidate them
+    QUERY_TTL_S = {"*IDN?": 3600.0, "INPut:FUNCtion?": 2.0, "INPut:STATe?": 2.0}
+
+    def scpi_query_cached(self, query: str, ttl: Optional[float] = None) -> Optional[str]:
+        """scpi_query with a short-lived per-connection reply cache (TTL from QUERY_TTL_S by default)."""
+        if ttl is None: ttl = self.QUERY_TTL_S.get(query, 0.0)
+        hit = self._query_cache.get(query)
+        now = time.monotonic()
+        if hit is not None and now - hit[0] < ttl:
+            return hit[1]
+        response = self.scpi_query(query)
+        if response is not None: self._query_cache[query] = (now, response)
+        return response
+
+    def _schedule_keepalive(self):
+        interval = float(self.config.get("keepalive_interval_s", 10))
+        if interval <= 0 or self._keepalive_job is not None: return
+        self._keepalive_job = self.master.after(int(interval * 1000), self._keepalive_tick)
+
+    def _keepalive_tick(self):
+        """Sends a cheap *OPC? when the link has been idle, keeping the TCP connection warm."""
+        self._keepalive_job = None
+        if self._test_mode_cached or not self.connected or not self.s: return
+        if time.monotonic() - self._last_io_ts >= float(self.config.get("keepalive_interval_s", 10)):
+            self.scpi_query("*OPC?")
+        self._schedule_keepalive()
+
+    def scpi_query_multi(self, queries: Sequence[str], query_fn=None) -> Optional[List[str]]:
+        """Sends several queries as one compound SCPI message and returns the per-query responses."""
+        response = (query_fn or self.scpi_query)(";:".join(q.lstrip(":") for q in queries))
+        if response is None: return None
+        fields = [f.strip() for f in response.split(";")]
+        if len(fields) != len(queries):
+            logging.warning(f"Compound query returned {len(fields)} fields, expected {len(queries)}: {response}")
+            return None
+        return fields
+
+    def _encode_command(self, command: str) -> bytes:
+        """Returns the newline-terminated bytes for a SCPI command, encoding each distinct string once."""
+        data = self._cmd_bytes_cache.get(command)
+        if data is None:
+            data = self._cmd_bytes_cache[command] = (command.strip() + '\n').encode()
+        return data
+
+    def _start_io_thread(self):
+        """Starts the socket I/O thread for the current connection."""
+        self._io_requests = queue.SimpleQueue(); self._io_errors = queue.SimpleQueue()
+        self._io_thread = threading.Thread(target=self._io_loop, args=(self.s, self._io_requests, self._io_errors),
+                                           name="scpi-io", daemon=True)
+        self._io_thread.start()
+        if self._io_error_job is None:
+            self._io_error_job = self.master.after(200, self._check_io_errors)
+
+    def _stop_io_thread(self, wait: bool = False):
+        """Asks the I/O thread to exit once queued messages are sent; optionally waits for it."""
+        thread = self._io_thread
+        if thread is None: return
+        self._io_requests.put(None)
+        if wait and thread is not threading.current_thread():
+            thread.join(timeout=self.socket_timeout)
+        self._io_thread = None
+
+    def _io_loop(self, sock: socket.socket, requests: "queue.SimpleQueue", errors: "queue.SimpleQueue"):
+        """I/O thread: sends queued SCPI messages in order and reads the reply for each query.
+
+        Items are (bytes, future); a None future means no reply is expected.
+        The loop ends on a None item or on the first socket error.
+        """
+        # Per-thread buffers, so a previous connection's thread that has not exited yet never
+        # shares them: reused recv_into space (no bytes object per recv) and the line assembler
+        # holding bytes received but not yet returned by _readline
+        recv_view = memoryview(bytearray(max(64, int(self.buffer_size))))
+        line_buf = bytearray()
+        sel = selectors.DefaultSelector()
+        sel.register(sock, selectors.EVENT_READ)
+        stale = False
+        next_send_earliest = 0.0
+        try:
+            while True:
+                item = requests.get()
+                if item is None: return
+                data, future = item
+                try:
+                    wait = next_send_earliest - time.monotonic()
+                    if wait > 0: time.sleep(wait)   # still settling after a mode change
+                    sock.sendall(data)
+                    if data in SLOW_SETTLE_COMMANDS:
+                        next_send_earliest = time.monotonic() + SLOW_SETTLE_S
+                    if future is None:
+                        continue
+                    if stale:
+                        self._discard_input(sock, sel, line_buf, recv_view); stale = False
+                    if b"\n" not in line_buf and not sel.select(self.socket_timeout):
+                        raise socket.timeout("timed out waiting for response")
+                    future.set_result(self._readline(sock, line_buf, recv_view))
+                except socket.timeout as e:
+                    # Keep the connection; whatever arrives late for this message is dropped
+                    # before the next query reads its reply.
+                    stale = True
+                    if future is not None: future.set_exception(e)
+                    else: logging.warning(f"Timeout sending '{data.decode('ascii', 'replace').strip()}'")
+                except (socket.error, BrokenPipeError, ValueError) as e:
+                    if future is not None: future.set_exception(e)
+                    else: errors.put((data, e))
+                    return
+        finally:
+            sel.close()
+
+    def _discard_input(self, sock: socket.socket, sel: selectors.BaseSelector, buf: bytearray, view: memoryview):
+        """Drops any bytes already waiting on the socket (late replies to timed-out queries)."""
+        buf.clear()
+        while sel.select(0):
+            if sock.recv_into(view) == 0:
+                raise ConnectionResetError("Instrument closed the connection")
+
+    def _check_io_errors(self):
+        """Reports fire-and-forget command failures from the I/O thread on the Tk thread."""
+        self._io_error_job = None
+        try:
+            data, e = self._io_errors.get_nowait()
+        except queue.Empty:
+            if self._io_thread is not None:
+                self._io_error_job = self.master.after(200, self._check_io_errors)
+            return
+        if not self.connected: return
+        command = data.decode("ascii", "replace").strip()
+        logging.error(f"Socket error sending command '{command}': {e}")
+        messagebox.showerror("Communication Error", f"Failed command: {command}\nError: {e}\nCheck connection.")
+        play_sound("error")
+        self.handle_connection_loss()
+
+    def _readline(self, sock: socket.socket, buf: bytearray, view: memoryview) -> str:
+        """Returns the next newline-terminated SCPI response; bytes past the newline stay in `buf` for the next call."""
+        end = buf.find(b"\n")
+        while end < 0:
+            n = sock.recv_into(view)
+            if n == 0: raise ConnectionResetError("Instrument closed the connection")
+            start = len(buf)
+            buf += view[:n]
+            end = buf.find(b"\n", start)
+        line = buf[:end].decode("ascii", "replace").strip()
+        del buf[:end + 1]
+        return line
 
     def handle_connection_loss(self):
         """Handles actions needed when real connection is lost."""
-        if self.test_mode.get(): return
+        if self._test_mode_cached: return
 
         logging.warning("Handling connection loss.")
         play_sound("error")
-        self.connected = False; self.s = None
+        sock, self.s = self.s, None
+        self.connected = False
+        self._stop_io_thread()
+        if sock is not None:
+            # Wakes an I/O thread still blocked on this socket; it exits on the resulting error
+            try: sock.shutdown(socket.SHUT_RDWR)
+            except OSError: pass
+            sock.close()
+        self._stop_acquisition()
         self.status_label.config(text="Disconnected", fg="red")
         if self.running:
             self.running = False; self.paused = False
@@ -825,43 +1568,19 @@ class HVBatteryDischargeApp:
         self.update_button_states()
 
         self._schedule_reconnect()
-    def _migrate_profile_step(self, step: Dict[str, Any]) -> Dict[str, Any]:
-        """Migrates old profile steps to new format with explicit stop conditions."""
-        if 'stop_condition_type' not in step:
-            step_type = step.get('type', 'CC').upper()
-            if 'stop_voltage' in step:
-                stop_value = step.pop('stop_voltage')
-                if step_type == 'CV':
-                    step['stop_condition_type'] = 'current'
-                    step['stop_condition_value'] = 0.1
-                    logging.warning(f"Migrating old CV step: Using default stop_current {step['stop_condition_value']}A. Please verify profile.")
-                else:
-                    step['stop_condition_type'] = 'voltage'
-                    step['stop_condition_value'] = stop_value
-            else:
-                if step_type == 'CV':
-                     step['stop_condition_type'] = 'current'
-                     step['stop_condition_value'] = 0.1
-                else:
-                     step['stop_condition_type'] = 'voltage'
-                     step['stop_condition_value'] = 0.0
-                logging.warning(f"Adding default stop condition for step type {step_type}")
-        return step
-
-
     def load_profiles(self):
         """Load profiles from JSON file into internal data structure."""
         """Loads discharge profiles, migrating old formats if necessary."""
         default_profile = {
                 "Default CC": [
-                    {"type": "CC", "value": 10.0, "stop_condition_type": "voltage", "stop_condition_value": 350.0},
-                    {"type": "CC", "value": 5.0, "stop_condition_type": "voltage", "stop_condition_value": 300.0},
+                    ProfileStep("CC", 10.0, "voltage", 350.0),
+                    ProfileStep("CC", 5.0, "voltage", 300.0),
                 ],
                 "Default CP": [
-                    {"type": "CP", "value": 2000.0, "stop_condition_type": "voltage", "stop_condition_value": 320.0},
+                    ProfileStep("CP", 2000.0, "voltage", 320.0),
                 ],
                 "Default CV": [
-                    {"type": "CV", "value": 380.0, "stop_condition_type": "current", "stop_condition_value": 0.5},
+                    ProfileStep("CV", 380.0, "current", 0.5),
                 ]
             }
         profiles_changed = False
@@ -871,25 +1590,22 @@ class HVBatteryDischargeApp:
                  self.profiles = default_profile
                  self.save_profiles()
             else:
-                with open(self.profiles_file, "r") as f:
-                    loaded_profiles_data = json.load(f)
+                with open(self.profiles_file, "rb") as f:
+                    raw = f.read()
+                    loaded_profiles_data = orjson.loads(raw) if orjson else json.loads(raw)
                     self.profiles.clear()
                     for name, steps in loaded_profiles_data.items():
                         migrated_steps = []
                         for step in steps:
-                             original_step_json = json.dumps(step, sort_keys=True)
-                             migrated_step = self._migrate_profile_step(step.copy())
+                             migrated_step, changed = ProfileStep.from_dict(step)
                              migrated_steps.append(migrated_step)
-                             if json.dumps(migrated_step, sort_keys=True) != original_step_json:
+                             if changed:
                                  profiles_changed = True
-                                 logging.info(f"Migrated step in profile '{name}': {original_step_json} -> {json.dumps(migrated_step, sort_keys=True)}")
+                                 logging.info(f"Migrated step in profile '{name}': {step} -> {migrated_step.as_dict()}")
                         self.profiles[name] = migrated_steps
 
-            profile_names = list(self.profiles.keys())
-            self.profile_dropdown["values"] = profile_names
-            if profile_names: self.profile_var.set(profile_names[0])
-            else: self.profile_var.set("")
-            logging.info(f"Loaded {len(profile_names)} profiles from {self.profiles_file}")
+            self._refresh_profile_dropdown()
+            logging.info(f"Loaded {len(self.profiles)} profiles from {self.profiles_file}")
             if profiles_changed:
                 logging.info("Profile format updated. Saving changes.")
                 self.save_profiles()
@@ -899,21 +1615,49 @@ class HVBatteryDischargeApp:
             messagebox.showerror("Profile Load Error", f"Could not load profiles from {self.profiles_file}.\nError: {e}\nUsing default profiles.")
             play_sound("error")
             self.profiles.clear(); self.profiles.update(default_profile)
-            profile_names = list(self.profiles.keys())
-            self.profile_dropdown["values"] = profile_names
-            if profile_names: self.profile_var.set(profile_names[0])
+            self._refresh_profile_dropdown()
         self.update_button_states()
 
 
+    def _refresh_profile_dropdown(self, select=None):
+        """Rebuilds the dropdown from the in-memory profiles; keeps the selection if it still exists."""
+        profile_names = list(self.profiles.keys())
+        self.profile_dropdown["values"] = profile_names
+        if select is None: select = self.profile_var.get()
+        if select in self.profiles: self.profile_var.set(select)
+        elif profile_names: self.profile_var.set(profile_names[0])
+        else: self.profile_var.set("")
+        self.update_button_states()
+
+
+    def _mark_profiles_dirty(self):
+        """Schedules a debounced save, so a burst of step edits writes the file once."""
+        self._profiles_dirty = True
+        if self._profiles_save_job is None:
+            self._profiles_save_job = self.master.after(500, self._flush_profiles)
+
+    def _flush_profiles(self):
+        """Saves profiles now if there are unsaved edits."""
+        if self._profiles_dirty: self.save_profiles()
+
     def save_profiles(self):
         """Save current profiles list to JSON file."""
-        """Saves the current profiles dictionary to the JSON file."""
+        """Saves the current profiles dictionary to the JSON file (atomically, via a temp file)."""
+        if self._profiles_save_job is not None:
+            try: self.master.after_cancel(self._profiles_save_job)
+            except Exception: pass
+            self._profiles_save_job = None
+        self._profiles_dirty = False
+        tmp_file = self.profiles_file.with_name(self.profiles_file.name + ".tmp")
         try:
-            for name, steps in self.profiles.items():
-                self.profiles[name] = [self._migrate_profile_step(step) for step in steps]
-
-            with open(self.profiles_file, "w") as f:
-                json.dump(self.profiles, f, indent=4)
+            pretty = self.config.get("profiles_pretty_print", False)
+            payload = {name: [step.as_dict() for step in steps] for name, steps in self.profiles.items()}
+            if orjson: data = orjson.dumps(payload, option=orjson.OPT_INDENT_2 if pretty else 0)
+            elif pretty: data = json.dumps(payload, indent=4).encode()
+            else: data = json.dumps(payload, separators=(",", ":")).encode()
+            with open(tmp_file, "wb") as f:
+                f.write(data)
+            os.replace(tmp_file, self.profiles_file)
             logging.info(f"Profiles saved to {self.profiles_file}")
         except IOError as e:
             logging.error(f"Failed to save profiles: {e}")
@@ -928,8 +1672,7 @@ class HVBatteryDischargeApp:
         if profile_name:
             if profile_name in self.profiles: messagebox.showwarning("Profile Exists", f"Profile '{profile_name}' already exists."); play_sound("warning"); return
             self.profiles[profile_name] = []
-            self.save_profiles(); self.load_profiles()
-            self.profile_var.set(profile_name)
+            self.save_profiles(); self._refresh_profile_dropdown(select=profile_name)
             messagebox.showinfo("Profile Added", f"Profile '{profile_name}' added. Edit to add steps.")
             self.edit_profile()
 
@@ -937,9 +1680,9 @@ class HVBatteryDischargeApp:
     def edit_profile(self):
         """Opens a window to edit the selected profile."""
         if self.running: messagebox.showwarning("Action Denied", "Cannot modify profiles while running."); play_sound("warning"); return
-        profile_name = self.profile_var.get()
+        profile_name = self._profile_name_cached
         if not profile_name: messagebox.showerror("Error", "Please select a profile to edit."); play_sound("error"); return
-        if profile_name not in self.profiles: messagebox.showerror("Error", f"Profile '{profile_name}' not found."); self.load_profiles(); play_sound("error"); return
+        if profile_name not in self.profiles: messagebox.showerror("Error", f"Profile '{profile_name}' not found."); self._refresh_profile_dropdown(); play_sound("error"); return
 
         self.edit_win = tk.Toplevel(self.master); self.edit_win.title(f"Edit Profile: {profile_name}")
         self.edit_win.transient(self.master); self.edit_win.grab_set()
@@ -953,19 +1696,26 @@ class HVBatteryDischargeApp:
              self.steps_tree.column(col_id, width=width, anchor='center')
         self.steps_tree.pack(side="top", fill="x", padx=5, pady=5)
 
+        def step_row_values(step: ProfileStep) -> tuple:
+            stop_cond_display = "Voltage <=" if step.stop_condition_type == 'voltage' else "Current <="
+            stop_val_unit = " V" if step.stop_condition_type == 'voltage' else " A"
+            return (step.type, step.value, stop_cond_display, f"{step.stop_condition_value:.2f}{stop_val_unit}")
+
+        # Row iids are the step indices; edits that keep indices stable update rows in place,
+        # anything else (removal) rebuilds the tree.
         def populate_steps_tree():
-            for item in self.steps_tree.get_children(): self.steps_tree.delete(item)
+            children = self.steps_tree.get_children()
+            if children: self.steps_tree.delete(*children)   # one Tcl call for all rows
             if profile_name in self.profiles:
                 for idx, step in enumerate(self.profiles[profile_name]):
-                    migrated_step = self._migrate_profile_step(step)
-                    stop_type = migrated_step.get('stop_condition_type', 'voltage')
-                    stop_val = migrated_step.get('stop_condition_value', 0.0)
-                    stop_cond_display = "Voltage <=" if stop_type == 'voltage' else "Current <="
-                    stop_val_unit = " V" if stop_type == 'voltage' else " A"
-                    self.steps_tree.insert("", tk.END, iid=str(idx), values=(
-                        migrated_step.get('type', 'N/A'), migrated_step.get('value', 'N/A'),
-                        stop_cond_display, f"{stop_val:.2f}{stop_val_unit}" ))
+                    self.steps_tree.insert("", tk.END, iid=str(idx), values=step_row_values(step))
             else: logging.warning(f"Profile '{profile_name}' disappeared."); self.edit_win.destroy()
+
+        def refresh_step_rows(indices):
+            steps = self.profiles.get(profile_name, [])
+            if len(self.steps_tree.get_children()) != len(steps): populate_steps_tree(); return
+            for idx in indices:
+                self.steps_tree.item(str(idx), values=step_row_values(steps[idx]))
         populate_steps_tree()
 
         ctrl_frame = tk.Frame(self.edit_win); ctrl_frame.pack(padx=10, pady=5, fill="x")
@@ -973,15 +1723,15 @@ class HVBatteryDischargeApp:
 
         tk.Label(add_frame, text="Type:").grid(row=0, column=0, padx=2, pady=2, sticky="w")
         new_type_var = tk.StringVar(value="CC")
-        type_combobox = ttk.Combobox(add_frame, textvariable=new_type_var, values=["CC", "CP", "CV"], state="readonly", width=5)
+        type_combobox = ttk.Combobox(add_frame, textvariable=new_type_var, values=list(STEP_TYPES), state="readonly", width=5)
         type_combobox.grid(row=0, column=1, padx=2, pady=2)
 
         tk.Label(add_frame, text="Value:").grid(row=1, column=0, padx=2, pady=2, sticky="w")
-        new_value_var = tk.DoubleVar(); tk.Entry(add_frame, textvariable=new_value_var, width=8).grid(row=1, column=1, padx=2, pady=2)
+        new_value_var = tk.StringVar(value="0.0"); tk.Entry(add_frame, textvariable=new_value_var, width=8).grid(row=1, column=1, padx=2, pady=2)
 
         stop_condition_label_var = tk.StringVar(value="Stop Voltage (V):")
         tk.Label(add_frame, textvariable=stop_condition_label_var).grid(row=2, column=0, padx=2, pady=2, sticky="w")
-        new_stop_value_var = tk.DoubleVar(); tk.Entry(add_frame, textvariable=new_stop_value_var, width=8).grid(row=2, column=1, padx=2, pady=2)
+        new_stop_value_var = tk.StringVar(value="0.0"); tk.Entry(add_frame, textvariable=new_stop_value_var, width=8).grid(row=2, column=1, padx=2, pady=2)
 
         def update_stop_label(*args):
             stop_condition_label_var.set("Stop Current (A):" if new_type_var.get() == "CV" else "Stop Voltage (V):")
@@ -989,16 +1739,14 @@ class HVBatteryDischargeApp:
 
         def add_step_action():
             if profile_name not in self.profiles: messagebox.showerror("Error", f"Profile '{profile_name}' gone.", parent=self.edit_win); self.edit_win.destroy(); return
-            try:
-                step_type = new_type_var.get(); value = new_value_var.get(); stop_value = new_stop_value_var.get()
-                if value <= 0: messagebox.showerror("Invalid Input", "Value must be positive.", parent=self.edit_win); return
-                if stop_value <= 0: messagebox.showerror("Invalid Input", "Stop Value must be positive.", parent=self.edit_win); return
-                stop_type = 'current' if step_type == 'CV' else 'voltage'
-                new_step = {"type": step_type, "value": value, "stop_condition_type": stop_type, "stop_condition_value": stop_value}
-                self.profiles[profile_name].append(new_step)
-                self.save_profiles(); populate_steps_tree()
-                new_value_var.set(0.0); new_stop_value_var.set(0.0)
-            except tk.TclError: messagebox.showerror("Invalid Input", "Enter valid numbers.", parent=self.edit_win)
+            new_step = ProfileStep.parse(new_type_var.get(), new_value_var.get(), new_stop_value_var.get())
+            if new_step is None: messagebox.showerror("Invalid Input", "Value and Stop Value must be positive numbers.", parent=self.edit_win); return
+            self.profiles[profile_name].append(new_step)
+            self._mark_profiles_dirty()
+            new_idx = len(self.profiles[profile_name]) - 1
+            if self.steps_tree.exists(str(new_idx)) or len(self.steps_tree.get_children()) != new_idx: populate_steps_tree()
+            else: self.steps_tree.insert("", tk.END, iid=str(new_idx), values=step_row_values(new_step))
+            new_value_var.set("0.0"); new_stop_value_var.set("0.0")
         tk.Button(add_frame, text="Add Step", command=add_step_action).grid(row=3, column=0, columnspan=2, pady=5)
 
         # --- Edit Selected Step ---
@@ -1008,16 +1756,16 @@ class HVBatteryDischargeApp:
         tk.Label(edit_sel_frame, text="Type:").grid(row=0, column=0, padx=2, pady=2, sticky="w")
         edit_type_var = tk.StringVar(value="CC")
         edit_type_cb = ttk.Combobox(edit_sel_frame, textvariable=edit_type_var,
-                                    values=["CC", "CP", "CV"], state="readonly", width=5)
+                                    values=list(STEP_TYPES), state="readonly", width=5)
         edit_type_cb.grid(row=0, column=1, padx=2, pady=2)
 
         tk.Label(edit_sel_frame, text="Value:").grid(row=1, column=0, padx=2, pady=2, sticky="w")
-        edit_value_var = tk.DoubleVar(value=0.0)
+        edit_value_var = tk.StringVar(value="0.0")
         tk.Entry(edit_sel_frame, textvariable=edit_value_var, width=8).grid(row=1, column=1, padx=2, pady=2)
 
         edit_stop_label_var = tk.StringVar(value="Stop Voltage (V):")
         tk.Label(edit_sel_frame, textvariable=edit_stop_label_var).grid(row=2, column=0, padx=2, pady=2, sticky="w")
-        edit_stop_value_var = tk.DoubleVar(value=0.0)
+        edit_stop_value_var = tk.StringVar(value="0.0")
         tk.Entry(edit_sel_frame, textvariable=edit_stop_value_var, width=8).grid(row=2, column=1, padx=2, pady=2)
 
         def _edit_sel_update_label(*_):
@@ -1029,17 +1777,11 @@ class HVBatteryDischargeApp:
             if not sel:
                 return
             idx = int(sel[0])
-            st = self._migrate_profile_step(self.profiles[profile_name][idx])
-            edit_type_var.set(st.get("type", "CC"))
-            try:
-                edit_value_var.set(float(st.get("value", 0.0)))
-            except Exception:
-                edit_value_var.set(0.0)
-            edit_stop_label_var.set("Stop Current (A):" if st.get("type", "CC").upper() == "CV" else "Stop Voltage (V):")
-            try:
-                edit_stop_value_var.set(float(st.get("stop_condition_value", 0.0)))
-            except Exception:
-                edit_stop_value_var.set(0.0)
+            st = self.profiles[profile_name][idx]
+            edit_type_var.set(st.type)
+            edit_value_var.set(str(st.value))
+            edit_stop_label_var.set("Stop Current (A):" if st.type == "CV" else "Stop Voltage (V):")
+            edit_stop_value_var.set(str(st.stop_condition_value))
 
         self.steps_tree.bind("<<TreeviewSelect>>", _populate_edit_fields_from_selection)
 
@@ -1048,29 +1790,18 @@ class HVBatteryDischargeApp:
             if not sel:
                 messagebox.showwarning("No Selection", "Select a step to update.", parent=self.edit_win)
                 return
-            try:
-                idx = int(sel[0])
-                new_type = edit_type_var.get()
-                new_val = float(edit_value_var.get())
-                new_stop = float(edit_stop_value_var.get())
-                if new_val <= 0 or new_stop <= 0:
-                    messagebox.showerror("Invalid Input", "Values must be positive.", parent=self.edit_win)
-                    return
-                stop_type = "current" if new_type == "CV" else "voltage"
-                self.profiles[profile_name][idx] = {
-                    "type": new_type,
-                    "value": new_val,
-                    "stop_condition_type": stop_type,
-                    "stop_condition_value": new_stop
-                }
-                self.save_profiles()
-                populate_steps_tree()
-                # Reselect same item
-                if self.steps_tree.exists(str(idx)):
-                    self.steps_tree.selection_set(str(idx))
-                    self.steps_tree.focus(str(idx))
-            except tk.TclError:
-                messagebox.showerror("Invalid Input", "Enter valid numbers.", parent=self.edit_win)
+            idx = int(sel[0])
+            new_step = ProfileStep.parse(edit_type_var.get(), edit_value_var.get(), edit_stop_value_var.get())
+            if new_step is None:
+                messagebox.showerror("Invalid Input", "Value and Stop Value must be positive numbers.", parent=self.edit_win)
+                return
+            self.profiles[profile_name][idx] = new_step
+            self._mark_profiles_dirty()
+            refresh_step_rows([idx])
+            # Reselect same item
+            if self.steps_tree.exists(str(idx)):
+                self.steps_tree.selection_set(str(idx))
+                self.steps_tree.focus(str(idx))
 
         tk.Button(edit_sel_frame, text="Update Step", command=update_selected_step).grid(row=3, column=0, columnspan=2, pady=5)
 
@@ -1085,6 +1816,7 @@ class HVBatteryDischargeApp:
             if not selected: messagebox.showwarning("No Selection", "Select a step to move.", parent=self.edit_win); return
             
             steps = self.profiles[profile_name]
+            touched = set()
             # Move all selected items
             for item_id in selected:
                 index = int(item_id)
@@ -1092,14 +1824,13 @@ class HVBatteryDischargeApp:
                 if 0 <= new_index < len(steps):
                     # Simple swap
                     steps[index], steps[new_index] = steps[new_index], steps[index]
+                    touched.update((index, new_index))
 
-            self.save_profiles()
-            populate_steps_tree()
+            self._mark_profiles_dirty()
+            refresh_step_rows(sorted(touched))   # only the swapped rows change
             # Reselect the moved items
             new_selection_ids = [str(int(item_id) + direction) for item_id in selected]
-            for new_id in new_selection_ids:
-                if self.steps_tree.exists(new_id):
-                    self.steps_tree.selection_add(new_id)
+            self.steps_tree.selection_set([i for i in new_selection_ids if self.steps_tree.exists(i)])
             if new_selection_ids:
                 self.steps_tree.focus(new_selection_ids[0])
 
@@ -1114,46 +1845,56 @@ class HVBatteryDischargeApp:
                 indices = sorted([int(item) for item in selected], reverse=True)
                 for i in indices:
                     if 0 <= i < len(self.profiles[profile_name]): del self.profiles[profile_name][i]
-                self.save_profiles(); populate_steps_tree()
+                self._mark_profiles_dirty(); populate_steps_tree()
         tk.Button(modify_frame, text="Remove Selected", command=remove_step_action, bg="#FF8C8C").pack(pady=5, padx=5, fill="x")
         
         tk.Button(self.edit_win, text="Done", command=self.edit_win.destroy).pack(pady=10)
         self.edit_win.wait_window()
+        self._flush_profiles()
 
 
     def delete_profile(self):
         """Deletes the selected profile after confirmation."""
         if self.running: messagebox.showwarning("Action Denied", "Cannot modify profiles while running."); play_sound("warning"); return
-        profile_name = self.profile_var.get()
+        profile_name = self._profile_name_cached
         if not profile_name: messagebox.showerror("Error", "Select profile to delete."); play_sound("error"); return
         if profile_name not in self.profiles: messagebox.showerror("Error", f"Profile '{profile_name}' not found."); play_sound("error"); return
         if messagebox.askyesno("Confirm Delete", f"Delete profile '{profile_name}'?", parent=self.master):
             del self.profiles[profile_name]
-            self.save_profiles(); self.load_profiles()
+            self.save_profiles(); self._refresh_profile_dropdown()
             messagebox.showinfo("Profile Deleted", f"Profile '{profile_name}' deleted.")
 
 
+    def _set_state(self, widget, state: str):
+        """Configures a widget's state only if it differs from the last one applied."""
+        if self._last_btn_state.get(widget) != state:
+            widget.config(state=state)
+            self._last_btn_state[widget] = state
+
     def update_button_states(self):
         """Enables/disables control buttons based on application state."""
         profiles_exist = hasattr(self, 'profiles') and self.profiles is not None
-        profile_selected = profiles_exist and self.profile_var.get()
-        self.test_mode_check.config(state=tk.DISABLED if self.running else tk.NORMAL)
+        profile_selected = bool(profiles_exist and self._profile_name_cached)
         is_connected = self.connected
         is_running = self.running
+        inputs = (is_connected, is_running, profile_selected, profiles_exist and bool(self.profiles))
+        if inputs == self._last_btn_inputs: return
+        self._last_btn_inputs = inputs
 
-        self.start_button.config(state=tk.NORMAL if is_connected and not is_running and profile_selected else tk.DISABLED)
-        self.pause_button.config(state=tk.NORMAL if is_connected and is_running else tk.DISABLED)
-        self.stop_button.config(state=tk.NORMAL if is_connected and is_running else tk.DISABLED)
-        self.reset_button.config(state=tk.DISABLED if is_running else tk.NORMAL)
+        self._set_state(self.test_mode_check, tk.DISABLED if is_running else tk.NORMAL)
+        self._set_state(self.start_button, tk.NORMAL if is_connected and not is_running and profile_selected else tk.DISABLED)
+        self._set_state(self.pause_button, tk.NORMAL if is_connected and is_running else tk.DISABLED)
+        self._set_state(self.stop_button, tk.NORMAL if is_connected and is_running else tk.DISABLED)
+        self._set_state(self.reset_button, tk.DISABLED if is_running else tk.NORMAL)
 
         profile_ui_state = tk.DISABLED if is_running else tk.NORMAL
         dropdown_state = tk.DISABLED if is_running else ("readonly" if profiles_exist and self.profiles else tk.DISABLED)
         edit_delete_state = tk.DISABLED if is_running else (tk.NORMAL if profile_selected else tk.DISABLED)
 
-        self.profile_dropdown.config(state=dropdown_state)
-        self.add_profile_button.config(state=profile_ui_state)
-        self.edit_profile_button.config(state=edit_delete_state)
-        self.delete_profile_button.config(state=edit_delete_state)
+        self._set_state(self.profile_dropdown, dropdown_state)
+        self._set_state(self.add_profile_button, profile_ui_state)
+        self._set_state(self.edit_profile_button, edit_delete_state)
+        self._set_state(self.delete_profile_button, edit_delete_state)
 
 
     def start_discharge(self):
@@ -1161,13 +1902,15 @@ class HVBatteryDischargeApp:
         """Starts the discharge process (real or simulated)."""
         if not self.connected: messagebox.showerror("Error", "Not connected."); play_sound("error"); return
         if self.running: messagebox.showwarning("Warning", "Already running."); play_sound("warning"); return
-        profile_name = self.profile_var.get()
+        profile_name = self._profile_name_cached
         if not profile_name or profile_name not in self.profiles: messagebox.showerror("Error", "Select valid profile."); play_sound("error"); return
 
-        self.profiles[profile_name] = [self._migrate_profile_step(step) for step in self.profiles[profile_name]]
+        # Steps were migrated when the profiles were loaded; the editor only writes complete steps
         self.current_profile_data = self.profiles[profile_name]
         self.current_profile_name = profile_name
         if not self.current_profile_data: messagebox.showerror("Error", f"Profile '{profile_name}' empty."); play_sound("error"); return
+        n_steps = len(self.current_profile_data)
+        self._step_cache = [self._precompute_step(i, n_steps, step) for i, step in enumerate(self.current_profile_data)]
 
         reg_num = simpledialog.askstring("Input Required", "Enter car registration number:", parent=self.master)
         if not reg_num: messagebox.showerror("Error", "Registration number required."); play_sound("error"); return
@@ -1191,25 +1934,15 @@ class HVBatteryDischargeApp:
 
         self.reset_data_internal()
         self.running = True; self.paused = False
-        self.start_time = time.time(); self.last_time = self.start_time
+        self.start_time = time.monotonic(); self.last_time = self.start_time
         self.current_step = 0
 
 
-                # Reset timeline and add a Start marker
-        try:
-            self.step_timeline.clear()
-        except Exception:
-            self.step_timeline = []
-        try:
-            self.step_markers.clear()
-        except Exception:
-            self.step_markers = []
-        self.step_markers.append((0.0, "Start"))
-        # Reset and add initial step marker at t=0
-        self.step_markers.clear()
-        self.step_markers.append((0.0, "Start"))
+        # Reset timeline and add the Start marker at t=0
+        self.step_timeline = []
+        self.step_markers = [(0.0, "Start")]
 
-        mode = "Test" if self.test_mode.get() else "Real"
+        mode = "Test" if self._test_mode_cached else "Real"
         self.current_discharge_id = self.db_manager.start_new_discharge(self.registration_number, self.current_profile_name, mode)
         if self.current_discharge_id == -1:
             messagebox.showerror("Database Error", "Could not create new discharge log in the database. Aborting.")
@@ -1217,15 +1950,14 @@ class HVBatteryDischargeApp:
             self.update_button_states()
             return
             
-        if self.test_mode.get():
+        if self._test_mode_cached:
             self.sim_voltage = self.config.get('test_mode_initial_voltage', 400.0)
             self.sim_current = 0.0; self.sim_power = 0.0
             self.sim_cv_current = self.config.get('test_mode_cv_current_start', 5.0)
             logging.info(f"TEST MODE: Starting simulation V={self.sim_voltage}")
 
         if not self.scpi_command("INPut:STATe 1"):
-             if not self.test_mode.get(): messagebox.showerror("Command Error", "Failed INPut:STATe 1."); self.stop_discharge(generate_report=False); return
-             else: logging.info("TEST MODE: Simulated INPut:STATe 1")
+             messagebox.showerror("Command Error", "Not connected: INPut:STATe 1 not sent."); self.stop_discharge(generate_report=False); return
 
         logging.info(f"Discharge started: {self.registration_number}, Profile: '{self.current_profile_name}'")
         self.apply_profile_step(); self.update_button_states(); self.run_update_loop()
@@ -1238,11 +1970,12 @@ class HVBatteryDischargeApp:
         if self.scpi_command(f"INPut:STATe {target_state}"):
             self.paused = not self.paused
             self.pause_button.config(text="Resume Discharge" if self.paused else "Pause Discharge")
-            if not self.paused: self.last_time = time.time()
+            if not self.paused: self.last_time = time.monotonic()
+            else: self.db_manager.flush(wait=False)   # nothing new arrives while paused; commit what we have
             logging.info(f"Discharge {'paused' if self.paused else 'resumed'}.")
             messagebox.showinfo("State Change", f"Discharge {'paused' if self.paused else 'resumed'}.", parent=self.master)
-        elif not self.test_mode.get():
-             messagebox.showerror("Command Error", f"Failed to {'pause' if not self.paused else 'resume'}.", parent=self.master)
+        else:
+             messagebox.showerror("Command Error", f"Not connected: failed to {'pause' if not self.paused else 'resume'}.", parent=self.master)
              play_sound("error")
         self.update_button_states()
 
@@ -1259,24 +1992,22 @@ class HVBatteryDischargeApp:
         """Stops the discharge process and performs cleanup."""
         was_running = self.running
         self.running = False; self.paused = False
+        self._stop_acquisition()
         logging.info("Stopping discharge process...")
 
         # Close any open timeline row
         try:
             if self.step_timeline and self.step_timeline[-1].get("end_s") is None:
-                end_s = (self.data_x[-1] if self.data_x else (time.time() - (self.start_time or time.time())))
+                end_s = (self.samples.t[-1] if len(self.samples) else (time.monotonic() - (self.start_time or time.monotonic())))
                 self.step_timeline[-1]["end_s"] = float(end_s)
         except Exception:
             pass
 
-        if self.connected:
-             if not self.scpi_command("INPut:STATe 0"):
-                  if not self.test_mode.get(): logging.warning("Failed stop command (INPut:STATe 0).")
-             elif self.test_mode.get(): logging.info("TEST MODE: Simulated INPut:STATe 0")
+        if self.connected: self.scpi_command("INPut:STATe 0")
         else: logging.warning("Cannot send stop command, not connected.")
         
         self.update_button_states()
-        self.elapsed_time_label.config(text="00:00:00")
+        self._set_status_widget(self.elapsed_time_label, text="00:00:00")
 
         self.discharge_comment = ""
         if was_running and generate_report:
@@ -1284,14 +2015,26 @@ class HVBatteryDischargeApp:
              if comment is not None:
                   self.discharge_comment = comment.strip()
         
+        samples = self.samples
+        if was_running and len(samples) > 1 and not samples.dropped:
+            # The live sum is a left-Riemann sum over jittery intervals; re-integrate the whole
+            # run once with the trapezoid rule over the same intervals it took sample-to-sample,
+            # keeping its own value for the partial spans that started at a resume
+            self.energy_discharged = _integrate_kwh(samples.t, samples.power, self._energy_skip) + self._energy_partial_kwh
+            self._set_status_widget(self.energy_label, text=f"{self.energy_discharged:.3f} kWh")
+
         if self.current_discharge_id != -1:
             self.db_manager.finish_discharge(self.current_discharge_id, self.energy_discharged, self.discharge_comment)
 
-        if was_running and generate_report and self.data_x:
+        if was_running and generate_report and len(samples):
             try:
-                self.create_discharge_certificate()
-                play_sound("success")
-                messagebox.showinfo("Discharge Stopped", "Discharge stopped. Certificate saved.", parent=self.master)
+                # The live buffer holds the whole run unless plot_points_max trimmed it; copy it,
+                # since the next run reuses the storage while the job may still be queued
+                in_memory = None if samples.dropped else tuple(np.array(col) for col in
+                                                                (samples.t, samples.voltage, samples.current, samples.power))
+                future = self.create_discharge_certificate(in_memory)
+                if future is not None: self._watch_certificate(future)   # reports success/failure when done
+                else: messagebox.showinfo("Discharge Stopped", "Discharge process stopped.", parent=self.master)
             except Exception as e:
                 logging.error(f"Failed certificate generation: {e}", exc_info=True)
                 play_sound("error")
@@ -1313,23 +2056,19 @@ class HVBatteryDischargeApp:
              messagebox.showinfo("Discharge Complete", "Discharge profile completed.", parent=self.master)
              self.stop_discharge(generate_report=True); return
 
-        step = self.current_profile_data[self.current_step]
-        step_type = step.get("type", "CC").upper()
-        value = step.get("value", 0.0)
+        c = self._step_cache[self.current_step]
+        step_type = c["type"]
+        value = c["value"]
         logging.info(f"Applying Step {self.current_step + 1}: Type={step_type}, Value={value}")
 
         try:
-            now_elapsed = time.time() - self.start_time if self.start_time else 0.0
+            now_elapsed = time.monotonic() - self.start_time if self.start_time else 0.0
             # Close previous open row
             if self.step_timeline and self.step_timeline[-1].get("end_s") is None:
                 self.step_timeline[-1]["end_s"] = now_elapsed
-            # Add concise marker
-            label = fmt_step(step)
-            try:
-                self.step_markers.append((now_elapsed, f"Step {self.current_step + 1}: {label}"))
-            except Exception:
-                pass
-            # Open new row
+            # One marker and one timeline row per step
+            label = c["label"]
+            self.step_markers.append((now_elapsed, f"Step {self.current_step + 1}: {label}"))
             self.step_timeline.append({
                 "idx": self.current_step + 1,
                 "label": label,
@@ -1338,44 +2077,21 @@ class HVBatteryDischargeApp:
             })
         except Exception:
             pass
-        try:
-            elapsed = time.time() - self.start_time if self.start_time else 0.0
-            self.step_markers.append((elapsed, f"Step {self.current_step + 1}: {step_type} {value}"))
-        except Exception:
-            pass
-
 
-        success = False; func_set = False; level_set = False
-        if step_type == "CC":
-            func_set = self.scpi_command("INPut:FUNCtion CC")
-        # Send the SCPI command to configure the load for this step
-            level_set = self.scpi_command(f"STATic:CC:HIGH:LEVel {value}")
-        # Send the SCPI command to configure the load for this step
-        elif step_type == "CP":
-            func_set = self.scpi_command("INPut:FUNCtion CP")
-        # Send the SCPI command to configure the load for this step
-            level_set = self.scpi_command(f"STATic:CP:HIGH:LEVel {value}")
-        # Send the SCPI command to configure the load for this step
-        elif step_type == "CV":
-            func_set = self.scpi_command("INPut:FUNCtion CV")
-        # Send the SCPI command to configure the load for this step
-            level_set = self.scpi_command(f"STATic:CV:HIGH:LEVel {value}")
-        # Send the SCPI command to configure the load for this step
-        else:
+        if c["func_cmd"] is None:
             play_sound("error")
             messagebox.showerror("Profile Error", f"Unsupported type '{step_type}'.", parent=self.master)
             logging.error(f"Unsupported type: {step_type}"); self.stop_discharge(generate_report=False); return
-        success = func_set and level_set
-
-        if not success and not self.test_mode.get():
-             error_msg = f"Failed Step {self.current_step + 1}."; error_detail = ""
-             if not func_set: error_detail = "(Set function failed)"
-             elif not level_set: error_detail = "(Set level failed)"
+        # Send the SCPI commands to configure the load for this step
+        self._sample_interval_s = self.SAMPLE_INTERVAL_S   # new setpoint: sample fast until it settles
+        # Both are only queued here; a send failure surfaces through _check_io_errors
+        if not (self.scpi_command(c["func_cmd"]) and self.scpi_command(c["level_cmd"])):
              play_sound("error")
-             messagebox.showerror("Command Error", f"{error_msg} {error_detail}", parent=self.master)
-             logging.error(f"Failed SCPI Step {self.current_step + 1} {error_detail}")
+             messagebox.showerror("Command Error", f"Failed Step {self.current_step + 1}: not connected.", parent=self.master)
+             logging.error(f"Failed SCPI Step {self.current_step + 1}: not connected")
              self.stop_discharge(generate_report=False); return
-        elif self.test_mode.get():
+        self._last_known_func = step_type
+        if self._test_mode_cached:
              logging.info(f"TEST MODE: Step {self.current_step + 1} applied. Target: {step_type}={value}")
              if step_type == "CV": self.sim_cv_current = self.config.get('test_mode_cv_current_start', 5.0)
         # Refresh step label
@@ -1383,169 +2099,351 @@ class HVBatteryDischargeApp:
 
 
 
+    SAMPLE_INTERVAL_S = 1.0
+    ACQ_QUEUE_MAX = 10000   # samples; bounds memory if the Tk side stops draining
+    DRAIN_INTERVAL_MS = 200
+
     def run_update_loop(self):
         """Periodic loop: read/simulate V/I/P, update plot and DB, check stop conditions."""
         """Handles the periodic fetching/simulating and processing of data."""
         if not self.running: return
 
+        if not self._test_mode_cached:
+            # Real instrument: sampling runs on the acquisition thread, Tk only drains its queue
+            if self.connected:
+                if self._acq_thread is None: self._sample_interval_s = self.SAMPLE_INTERVAL_S
+                self._start_acquisition()
+            else: self.handle_connection_loss()
+            return
+
         if self.connected and not self.paused:
               try:
-                  voltage, current, power = None, None, None
-                  if self.test_mode.get(): voltage, current, power = self._simulate_measurements()
-                  else: voltage, current, power = self.fetch_measurements()
-
+                  voltage, current, power = self._simulate_measurements()
                   if voltage is None or current is None or power is None:
-                      if not self.test_mode.get(): logging.warning("Failed fetch.")
-                      else: logging.error("Simulation failed."); self.stop_discharge(generate_report=False); return
-                      self.master.after(1000, self.run_update_loop); return
-
-                  self.update_measurement_display(voltage, current, power)
-
-                  self._update_step_label(voltage, current)
-                  current_time = time.time(); elapsed_total = 0.0
-                  if self.start_time:
-                       elapsed_total = current_time - self.start_time
-                       self.elapsed_time_label.config(text=f"{str(timedelta(seconds=int(elapsed_total)))}")
-                       if self.last_time:
-                           elapsed_step = current_time - self.last_time
-                           if 0 < elapsed_step < 5.0:
-                                self.energy_discharged += (power * elapsed_step) / 3_600_000
-                                self.energy_label.config(text=f"{self.energy_discharged:.3f} kWh")
-                           else: logging.warning(f"Unusual step time: {elapsed_step:.2f}s.")
-                  self.last_time = current_time
-
-                  self.data_x.append(elapsed_total); self.data_voltage.append(voltage)
-                  self.data_current.append(current); self.data_power.append(power)
-                  self.db_manager.log_data_point(self.current_discharge_id, elapsed_total, voltage, current, power)
-                  self.update_plot()
-
-                  try:
-                       self._append_live_row(elapsed_total, voltage, current, power)
-                  except Exception:
-                       pass
-                  if self.current_step < len(self.current_profile_data):
-                       step = self.current_profile_data[self.current_step]
-                       stop_type = step.get("stop_condition_type", "voltage")
-                       stop_value = step.get("stop_condition_value", 0.0)
-                       stop_met = False; value_to_check = 0.0; log_msg = ""
-
-                       if stop_type == 'voltage':
-                            value_to_check = self.sim_voltage if self.test_mode.get() else voltage
-                            if value_to_check <= stop_value: stop_met = True; log_msg = f"Stop V ({stop_value}V) met (V={value_to_check:.2f})"
-                       elif stop_type == 'current':
-                            value_to_check = self.sim_current if self.test_mode.get() else current
-                            if value_to_check <= stop_value: stop_met = True; log_msg = f"Stop I ({stop_value}A) met (I={value_to_check:.2f})"
-
-                       if stop_met:
-                            logging.info(f"{log_msg}. Step {self.current_step + 1} finished.")
-                            self.current_step += 1
-                            self.apply_profile_step()
-
+                      logging.error("Simulation failed."); self.stop_discharge(generate_report=False); return
+                  self._process_sample(time.time(), time.monotonic(), voltage, current, power)
               except Exception as e: logging.error(f"Update loop error: {e}", exc_info=True); play_sound("error")
-        elif not self.connected and not self.test_mode.get(): self.handle_connection_loss()
 
         if self.running: self.master.after(1000, self.run_update_loop)
 
+    def _start_acquisition(self):
+        """Starts the acquisition thread and the Tk-side drain for the current run (no-op if running)."""
+        if self._acq_thread is None or not self._acq_thread.is_alive():
+            # Fresh event and queue per run: a worker from a previous run that is still stuck in a
+            # query can only ever post into its own, abandoned queue
+            self._acq_stop = threading.Event()
+            self._acq_queue = queue.Queue(maxsize=self.ACQ_QUEUE_MAX)
+            self._acq_thread = threading.Thread(target=self._acq_worker, args=(self._acq_stop, self._acq_queue),
+                                                name="acquisition", daemon=True)
+            self._acq_thread.start()
+        if self._drain_job is None:
+            self._drain_job = self.master.after(self.DRAIN_INTERVAL_MS, self._drain_queue)
+
+    def _stop_acquisition(self):
+        """Signals the acquisition thread to exit and drops samples it has not delivered yet."""
+        if self._acq_thread is not None:
+            self._acq_stop.set()
+            self._acq_thread = None
+        if self._drain_job is not None:
+            try: self.master.after_cancel(self._drain_job)
+            except Exception: pass
+            self._drain_job = None
+        # The worker is not joined (it may sit in a query for up to the I/O timeout); detach from
+        # its queue instead of draining it, so nothing it posts later reaches the next run
+        self._acq_queue = queue.Queue(maxsize=self.ACQ_QUEUE_MAX)
+
+    def _acq_worker(self, stop: threading.Event, out: "queue.Queue"):
+        """Acquisition thread: reads V/I/P every _sample_interval_s on a monotonic schedule.
+
+        Puts ("sample", epoch_ts, monotonic_ts, v, c, p) or ("error", exc) on `out`; never touches Tk.
+        """
+        next_t = time.monotonic(); dropped = 0
+        while not stop.is_set():
+            if self.running and not self.paused:
+                try:
+                    v, c, p = self.fetch_measurements(self._io_query)
+                    item = ("sample", time.time(), time.monotonic(), v, c, p)
+                except (socket.error, BrokenPipeError, FutureTimeoutError) as e:
+                    item = ("error", e)
+                if stop.is_set(): return   # stopped while the query was in flight
+                try:
+                    out.put_nowait(item)
+                except queue.Full:
+                    # Never block the sampler on a stalled GUI; the samples are lost to display and DB
+                    dropped += 1
+                    if dropped == 1 or dropped % 100 == 0:
+                        logging.warning("Acquisition queue full, %d sample(s) dropped.", dropped)
+                if item[0] == "error" and not isinstance(item[1], (socket.timeout, FutureTimeoutError)): return
+            next_t += self._sample_interval_s   # set by the Tk side, see _adapt_sample_interval
+            delay = next_t - time.monotonic()
+            if delay < 0: next_t = time.monotonic(); delay = 0   # fell behind: resync rather than burst
+            stop.wait(delay)
+
+    def _drain_queue(self):
+        """Tk side of acquisition: processes every queued sample, then reschedules itself."""
+        self._drain_job = None
+        if not self.running: self._stop_acquisition(); return
+        rows: List[tuple] = []   # DB rows for this drain, handed over in one log_data_points call
+        while self.running:
+            try: item = self._acq_queue.get_nowait()
+            except queue.Empty: break
+            if item[0] == "error":
+                self._log_rows(rows)   # before a possible connection-loss finish_discharge
+                self._handle_query_error("MEASure", item[1]); continue
+            _, ts, mono_ts, voltage, current, power = item
+            if voltage is None or current is None or power is None: logging.warning("Failed fetch."); continue
+            try: self._process_sample(ts, mono_ts, voltage, current, power, rows)
+            except Exception as e: logging.error(f"Update loop error: {e}", exc_info=True); play_sound("error")
+        self._log_rows(rows)
+        if not self.running: self._stop_acquisition(); return
+        if not self.connected: self._stop_acquisition(); self.handle_connection_loss(); return
+        self._drain_job = self.master.after(self.DRAIN_INTERVAL_MS, self._drain_queue)
+
+    def _log_rows(self, rows: List[tuple]):
+        """Hands rows collected by _drain_queue to the database buffer and empties the list."""
+        if rows:
+            self.db_manager.log_data_points(rows); rows.clear()
+
+    def _process_sample(self, wall_time: float, current_time: float, voltage: float, current: float, power: float,
+                        rows: Optional[List[tuple]] = None):
+        """Displays, logs and plots one sample, integrates energy and checks the step's stop condition.
+
+        `wall_time` (epoch) is only stored in the DB; elapsed and step times use the monotonic `current_time`.
+        With `rows`, the DB row is appended there for the caller to log in bulk instead of logged at once.
+        """
+        self.update_measurement_display(voltage, current, power)
+
+        self._update_step_label(voltage, current)
+        elapsed_total = 0.0
+        if self.start_time:
+             elapsed_total = current_time - self.start_time
+             self._set_status_widget(self.elapsed_time_label, text=str(timedelta(seconds=int(elapsed_total))))
+             if self.last_time:
+                 elapsed_step = current_time - self.last_time
+                 if 0 < elapsed_step < max(5.0, 2 * self._sample_interval_s):
+                      step_kwh = (power * elapsed_step) / 3_600_000
+                      self.energy_discharged += step_kwh
+                      self._set_status_widget(self.energy_label, text=f"{self.energy_discharged:.3f} kWh")
+                      if self.last_time != self._prev_sample_time:
+                           self._energy_skip.append(len(self.samples)); self._energy_partial_kwh += step_kwh
+                 else:
+                      logging.warning(f"Unusual step time: {elapsed_step:.2f}s.")
+                      self._energy_skip.append(len(self.samples))
+        self.last_time = current_time
+        self._prev_sample_time = current_time
+
+        self.samples.append(elapsed_total, voltage, current, power)
+        if rows is None:
+            self.db_manager.log_data_point(self.current_discharge_id, elapsed_total, voltage, current, power,
+                                           timestamp=wall_time)
+        else:
+            rows.append((self.current_discharge_id, wall_time, elapsed_total, voltage, current, power))
+        self.request_plot_update()
 
-    def fetch_measurements(self) -> Tuple[Optional[float], Optional[float], Optional[float]]:
-         """Fetches Voltage, Current, Power from the real instrument."""
-         if self.test_mode.get(): logging.error("fetch_measurements in Test Mode."); return self._simulate_measurements()
+        try:
+             self._append_live_row(elapsed_total, voltage, current, power)
+        except Exception:
+             pass
+        if self.current_step < len(self.current_profile_data):
+             c = self._step_cache[self.current_step]
+             stop_type, stop_value = c["stop_type"], c["stop_value"]
+             test_mode = self._test_mode_cached
+             stop_met = False; value_to_check = 0.0; log_msg = ""
+
+             if stop_type == 'voltage':
+                  value_to_check = self.sim_voltage if test_mode else voltage
+                  if value_to_check <= stop_value: stop_met = True; log_msg = f"Stop V ({stop_value}V) met (V={value_to_check:.2f})"
+             elif stop_type == 'current':
+                  value_to_check = self.sim_current if test_mode else current
+                  if value_to_check <= stop_value: stop_met = True; log_msg = f"Stop I ({stop_value}A) met (I={value_to_check:.2f})"
+
+             if stop_met:
+                  logging.info(f"{log_msg}. Step {self.current_step + 1} finished.")
+                  if rows is not None: self._log_rows(rows)   # the last step may finish the discharge
+                  self.current_step += 1
+                  self.apply_profile_step()
+             elif not test_mode:
+                  self._adapt_sample_interval(stop_type, stop_value, voltage, current)
+
+    def _adapt_sample_interval(self, stop_type: str, stop_value: float, voltage: float, current: float):
+        """Slows real-instrument sampling to slow_interval_ms while the voltage is flat.
+
+        Sampling stays at SAMPLE_INTERVAL_S while V moved more than stable_dv_thresh over the
+        last 5 samples, or once the reading is within 10% of the step's stop value.
+        """
+        fast = self.SAMPLE_INTERVAL_S
+        watched = voltage if stop_type == 'voltage' else current
+        v = self.samples.voltage[-6:]
+        if len(v) < 6 or abs(watched - stop_value) <= abs(stop_value) * 0.1:
+            self._sample_interval_s = fast; return
+        thresh = float(self.config.get("stable_dv_thresh", 0.1))
+        stable = float(np.abs(np.diff(v)).max()) < thresh
+        self._sample_interval_s = max(fast, self.config.get("slow_interval_ms", 3000) / 1000.0) if stable else fast
+
+
+    MEAS_QUERIES = ("MEASure:VOLTage?", "MEASure:CURRent?", "MEASure:POWer?")
+
+    def fetch_measurements(self, query_fn=None) -> Tuple[Optional[float], Optional[float], Optional[float]]:
+         """Fetches Voltage, Current, Power from the real instrument.
+
+         query_fn defaults to scpi_query; the acquisition thread passes _io_query so errors raise instead of touching Tk.
+         """
+         if self._test_mode_cached: logging.error("fetch_measurements in Test Mode."); return self._simulate_measurements()
          if not self.connected: return None, None, None
-         v_str = self.scpi_query("MEASure:VOLTage?"); c_str = self.scpi_query("MEASure:CURRent?"); p_str = self.scpi_query("MEASure:POWer?")
-         voltage = self._parse_measurement(v_str, "V"); current = self._parse_measurement(c_str, "A"); power = self._parse_measurement(p_str, "W")
+         query = query_fn or self.scpi_query
+         fields = self.scpi_query_multi(self.MEAS_QUERIES, query) if self._compound_meas_ok else None
+         if fields: v_str, c_str, p_str = fields
+         elif not self.connected: return None, None, None
+         else:
+             v_str, c_str, p_str = (query(q) for q in self.MEAS_QUERIES)
+         voltage = _parse_measurement(v_str, "V"); current = _parse_measurement(c_str, "A"); power = _parse_measurement(p_str, "W")
          if voltage is None or current is None or power is None: logging.warning("Failed fetch/parse real."); return None, None, None
+         if not fields and self._compound_meas_ok:
+             # Separate queries work where the compound one didn't: the instrument doesn't support it
+             logging.warning("Compound measurement query failed; using separate queries from now on.")
+             self._compound_meas_ok = False
          return voltage, current, power
 
 
+    SIM_BLOCK_LEN = 256
+
     def _simulate_measurements(self) -> Tuple[Optional[float], Optional[float], Optional[float]]:
         """Generates simulated V, C, P values for Test Mode."""
         if not self.running or self.paused or not self.current_profile_data or self.current_step >= len(self.current_profile_data):
             return self.sim_voltage, self.sim_current, self.sim_power
         try:
-            step = self.current_profile_data[self.current_step]; step_type = step.get("type", "CC").upper(); target_value = step.get("value", 0.0)
-            noise_factor = 0.02; resist = self.sim_resistance_factor; cv_decay = self.config.get('test_mode_cv_current_decay', 0.05)
-
-            if step_type == "CC":
-                self.sim_current = target_value * (1 + random.uniform(-noise_factor, noise_factor))
-                self.sim_voltage -= (self.sim_current * resist) + random.uniform(0.01, 0.05)
-                self.sim_power = self.sim_voltage * self.sim_current
-            elif step_type == "CP":
-                self.sim_power = target_value * (1 + random.uniform(-noise_factor, noise_factor))
-                self.sim_current = self.sim_power / self.sim_voltage if self.sim_voltage > 1.0 else 0.0
-                self.sim_voltage -= (self.sim_current * resist * 0.5) + random.uniform(0.01, 0.05)
-            elif step_type == "CV":
-                target_voltage = target_value
-                diff = target_voltage - self.sim_voltage
-                self.sim_voltage += diff * 0.1 + random.uniform(-0.05, 0.05)
-                self.sim_cv_current *= (1 - cv_decay); self.sim_cv_current = max(0.01, self.sim_cv_current)
-                self.sim_current = self.sim_cv_current * (1 + random.uniform(-noise_factor, noise_factor))
-                self.sim_power = self.sim_voltage * self.sim_current
-            else: self.sim_current = 0.0; self.sim_power = 0.0; self.sim_voltage -= random.uniform(0.01, 0.03)
-
-            self.sim_voltage = max(0.0, self.sim_voltage)
-            if self.sim_voltage < 1.0: self.sim_current = 0.0; self.sim_power = 0.0
-
-            logging.debug(f"Sim Step {self.current_step+1}({step_type}): V={self.sim_voltage:.2f}, I={self.sim_current:.2f}, P={self.sim_power:.2f}")
+            step = self.current_profile_data[self.current_step]; step_type = step.type; target_value = step.value
+            key = (self.current_step, step_type, target_value)
+            blk = self._sim_block
+            # Regenerate when the step changed, the block ran out, or the sim state was reset elsewhere
+            if (blk is None or blk["key"] != key or blk["i"] >= len(blk["v"])
+                    or blk["state"] != (self.sim_voltage, self.sim_cv_current)):
+                blk = self._sim_block = self._simulate_block(step_type, target_value)
+                blk["key"] = key
+            i = blk["i"]; blk["i"] = i + 1
+            self.sim_voltage = float(blk["v"][i]); self.sim_current = float(blk["c"][i]); self.sim_power = float(blk["p"][i])
+            if blk["cv"] is not None: self.sim_cv_current = float(blk["cv"][i])
+            blk["state"] = (self.sim_voltage, self.sim_cv_current)
+
+            logging.debug("Sim Step %d(%s): V=%.2f, I=%.2f, P=%.2f", self.current_step + 1, step_type,
+                          self.sim_voltage, self.sim_current, self.sim_power)
             return self.sim_voltage, self.sim_current, self.sim_power
         except Exception as e: logging.error(f"Simulation error: {e}", exc_info=True); return None, None, None
 
+    def _simulate_block(self, step_type: str, target_value: float) -> Dict[str, Any]:
+        """Vectorized simulation of the next SIM_BLOCK_LEN ticks from the current sim state.
 
-    def _parse_measurement(self, response: Optional[str], unit: str) -> Optional[float]:
-        """Convert SCPI measurement response string to float, stripping units."""
-        """Safely parses instrument response string to float."""
-        if response is None: return None
-        try:
-            value_str = response.upper().replace(unit.upper(), "").strip()
-            if not value_str or not all(c in '0123456789.-+eE' for c in value_str) or value_str.count('.') > 1 or value_str.count('-') > 1 or value_str.count('+') > 1:
-                 logging.warning(f"Could not parse '{response}' as float after removing '{unit}'.")
-                 return None
-            return float(value_str)
-        except (ValueError, TypeError) as e:
-            logging.error(f"Failed parsing measurement '{response}': {e}")
-            return None
-
+        Same model as the per-tick simulator: CC/CV/idle use closed forms over
+        pre-drawn noise, CP loops over it since its current depends on voltage.
+        """
+        n = self.SIM_BLOCK_LEN; rng = self._sim_rng
+        noise = 1 + rng.uniform(-self.SIM_NOISE_FACTOR, self.SIM_NOISE_FACTOR, n)
+        model = self._SIM_MODELS.get(step_type, HVBatteryDischargeApp._sim_idle)
+        volt, cur, powr, cv = model(self, n, rng, self.sim_voltage, target_value, noise)
+        dead = volt < 1.0
+        cur[dead] = 0.0; powr[dead] = 0.0
+        return {"v": volt, "c": cur, "p": powr, "cv": cv, "i": 0, "key": None, "state": None}
+
+    # Per-step-type models: (n, rng, v0, target, noise) -> (volt, cur, powr, cv_current or None)
+    SIM_NOISE_FACTOR = 0.02
+
+    def _sim_cc(self, n, rng, v0, target_value, noise):
+        cur = target_value * noise
+        # Every tick drops the voltage, so clamping the cumulative drop equals clamping per tick
+        volt = np.maximum(0.0, v0 - np.cumsum(cur * self.sim_resistance_factor + rng.uniform(0.01, 0.05, n)))
+        return volt, cur, volt * cur, None
+
+    def _sim_cp(self, n, rng, v0, target_value, noise):
+        powr = target_value * noise; drop = rng.uniform(0.01, 0.05, n)
+        cur = np.empty(n); volt = np.empty(n); v = v0; half_r = self.sim_resistance_factor * 0.5
+        for k in range(n):
+            c = powr[k] / v if v > 1.0 else 0.0
+            v = max(0.0, v - (c * half_r) - drop[k])
+            cur[k] = c; volt[k] = v
+        return volt, cur, powr, None
+
+    def _sim_cv(self, n, rng, v0, target_value, noise):
+        # V_k - T = 0.9 * (V_{k-1} - T) + e_k, solved in closed form
+        k = np.arange(1, n + 1); g = 0.9 ** k
+        volt = target_value + g * ((v0 - target_value) + np.cumsum(rng.uniform(-0.05, 0.05, n) / g))
+        neg = np.flatnonzero(volt < 0.0)
+        if neg.size:   # clamp the first negative sample and restart the next block from 0 V
+            n = int(neg[0]) + 1; volt = volt[:n]; volt[-1] = 0.0; k = k[:n]; noise = noise[:n]
+        cv = np.maximum(0.01, self.sim_cv_current * self._sim_cv_keep ** k)
+        cur = cv * noise
+        return volt, cur, volt * cur, cv
+
+    def _sim_idle(self, n, rng, v0, target_value, noise):
+        volt = np.maximum(0.0, v0 - np.cumsum(rng.uniform(0.01, 0.03, n)))
+        return volt, np.zeros(n), np.zeros(n), None
+
+    _SIM_MODELS = {"CC": _sim_cc, "CP": _sim_cp, "CV": _sim_cv}
+
+
+    def update_measurement_display(self, v: Optional[float], c: Optional[float], p: Optional[float]):
+         """Updates the measurement labels in the UI; a None value shows dashes. Never talks to the instrument."""
+         set_text = self._set_status_widget
+         set_text(self.voltage_label, text=f"{v:.2f} V" if v is not None else "--- V")
+         set_text(self.current_label, text=f"{c:.2f} A" if c is not None else "--- A")
+         set_text(self.power_label, text=f"{p:.2f} W" if p is not None else "--- W")
+
+    @staticmethod
+    def _precompute_step(i: int, n_steps: int, step: ProfileStep) -> Dict[str, Any]:
+        """Everything per-tick code needs about profile step `i`, formatted once at run start."""
+        entry = _STEP_CMDS.get(step.type)
+        unit = "V" if step.stop_condition_type == "voltage" else "A"
+        return {
+            "type": step.type, "value": step.value,
+            "stop_type": step.stop_condition_type, "stop_value": step.stop_condition_value,
+            "unit": unit,
+            "label": _format_step_label(step),
+            "text": f"Step {i+1}/{n_steps} — {step.type} {step.value} until {step.stop_condition_value}{unit}",
+            "func_cmd": entry[0] if entry else None,
+            "level_cmd": entry[1].format(v=step.value) if entry else None,
+        }
 
-    def update_measurement_display(self, voltage: Optional[float] = None, current: Optional[float] = None, power: Optional[float] = None):
-         """Updates the measurement labels in the UI."""
-         if voltage is None or current is None or power is None:
-              if self.test_mode.get(): v, c, p = self.sim_voltage, self.sim_current, self.sim_power
-              elif self.connected: v, c, p = self.fetch_measurements()
-              else: v, c, p = 0.0, 0.0, 0.0
-         else: v, c, p = voltage, current, power
-         self.voltage_label.config(text=f"{v:.2f} V" if v is not None else "--- V")
-         self.current_label.config(text=f"{c:.2f} A" if c is not None else "--- A")
-         self.power_label.config(text=f"{p:.2f} W" if p is not None else "--- W")
     def _update_step_label(self, now_v: float = None, now_i: float = None):
         try:
             if not self.current_profile_data or self.current_step >= len(self.current_profile_data):
-                self.step_label.config(text="Step —"); return
-            step = self.current_profile_data[self.current_step]
-            typ = str(step.get("type","?")).upper()
-            val = step.get("value","?")
-            stop_t = step.get("stop_condition_type","voltage")
-            stop_v = step.get("stop_condition_value",0.0)
-            unit = "V" if stop_t=="voltage" else "A"
-            hint_val = (now_v if stop_t=="voltage" else now_i)
-            hint = f" (now {hint_val:.2f}{unit})" if hint_val is not None else ""
-            self.step_label.config(text=f"Step {self.current_step+1}/{len(self.current_profile_data)} — {typ} {val} until {stop_v}{unit}{hint}")
+                self._set_status_widget(self.step_label, text="Step —"); return
+            c = self._step_cache[self.current_step]
+            hint_val = (now_v if c["stop_type"]=="voltage" else now_i)
+            hint = f" (now {hint_val:.2f}{c['unit']})" if hint_val is not None else ""
+            self._set_status_widget(self.step_label, text=c["text"] + hint)
         except Exception:
             pass
 
     def _append_live_row(self, t, v, a, w):
+        row = (f"{t:.0f}", f"{v:.2f}", f"{a:.2f}", f"{w:.2f}")
+        self._live_rows.append(row)
         try:
-            maxn = int(self.config.get("live_table_points", 12))
-            self.live_tbl.insert("", "end", values=(f"{t:.0f}", f"{v:.2f}", f"{a:.2f}", f"{w:.2f}"))
-            items = self.live_tbl.get_children()
-            for iid in items[:-maxn]:
-                self.live_tbl.delete(iid)
+            if not self.live_tbl.winfo_viewable():
+                self._live_tbl_stale = True; return
+            if self._live_tbl_stale:
+                self._refresh_live_tbl(); return
+            self.live_tbl.insert("", "end", values=row)
+            stale = self.live_tbl.get_children()[:-self._live_rows.maxlen]
+            if stale: self.live_tbl.delete(*stale)
+        except Exception:
+            pass
+
+    def _refresh_live_tbl(self):
+        """Rebuilds the recent-samples table from _live_rows after it was off screen."""
+        try:
+            self.live_tbl.delete(*self.live_tbl.get_children())
+            for row in self._live_rows:
+                self.live_tbl.insert("", "end", values=row)
+            self._live_tbl_stale = False
         except Exception:
             pass
 
     def _copy_live_table(self):
         try:
-            rows = [self.live_tbl.item(iid)["values"] for iid in self.live_tbl.get_children()]
-            rows = [self.live_tbl.item(iid)["values"] for iid in self.live_tbl.get_children()]
-            txt = "Time(s)\tV\tA\tW\n" + "\n".join("\t".join(map(str, r)) for r in rows)
+            buf = io.StringIO()
+            buf.write("Time(s)\tV\tA\tW\n")
+            for row in self._live_rows:   # rows are already formatted strings
+                buf.write("\t".join(row)); buf.write("\n")
+            txt = buf.getvalue()
             self.master.clipboard_clear()
             self.master.clipboard_append(txt)
             self.master.update()
@@ -1559,7 +2457,7 @@ class HVBatteryDischargeApp:
         save_config(self.config)
 
     def _schedule_reconnect(self):
-        if self.test_mode.get() or not self.config.get("auto_reconnect", True):
+        if self._test_mode_cached or not self.config.get("auto_reconnect", True):
             return
         if getattr(self, "_reconnect_job", None):
             return
@@ -1572,8 +2470,12 @@ class HVBatteryDischargeApp:
                         self.resume_btn.config(state="normal")
                 else:
                     self._schedule_reconnect()
-        interval_ms = int(self.config.get("auto_reconnect_interval_s", 5) * 1000)
-        self._reconnect_job = self.master.after(interval_ms, tick)
+        # Exponential backoff from 100 ms, capped at the configured interval, with +/-20% jitter
+        cap_s = float(self.config.get("auto_reconnect_interval_s", 5))
+        attempts = getattr(self, "_reconnect_attempts", 0)
+        delay_s = min(cap_s, 0.1 * (2 ** attempts)) * (0.8 + 0.4 * random.random())
+        self._reconnect_attempts = attempts + 1
+        self._reconnect_job = self.master.after(int(delay_s * 1000), tick)
 
     def _cancel_reconnect(self):
         if getattr(self, "_reconnect_job", None):
@@ -1595,11 +2497,11 @@ class HVBatteryDischargeApp:
         self.running = True
         self.paused = False
         if self.start_time is None:
-            self.start_time = time.time()
+            self.start_time = time.monotonic()
             self.last_time = self.start_time
         self.apply_profile_step()
         if not self.scpi_command("INPut:STATe 1"):
-            messagebox.showerror("Command Error", "Failed INPut:STATe 1.", parent=self.master)
+            messagebox.showerror("Command Error", "Not connected: INPut:STATe 1 not sent.", parent=self.master)
             self.running = False
             return
         self.update_button_states()
@@ -1608,20 +2510,20 @@ class HVBatteryDischargeApp:
         self.resume_btn.config(state="disabled")
 
     def run_calibration_check(self):
-        if self.test_mode.get():
+        if self._test_mode_cached:
             messagebox.showinfo("Verification", "In Test Mode; real instrument not queried.", parent=self.master)
             return
         if not self.connect_instrument():
             messagebox.showerror("Verification", "Not connected.", parent=self.master)
             return
         results = []
-        idn = self.scpi_query("*IDN?")
+        idn = self.scpi_query_cached("*IDN?")
         results.append(("*IDN?", idn or "—"))
-        v = self.scpi_query("MEASure:VOLTage?")
-        c = self.scpi_query("MEASure:CURRent?")
-        p = self.scpi_query("MEASure:POWer?")
+        # One round trip for V/I/P, like fetch_measurements; separate queries if the load rejects it
+        fields = self.scpi_query_multi(self.MEAS_QUERIES) if self._compound_meas_ok else None
+        v, c, p = fields if fields else (self.scpi_query(q) for q in self.MEAS_QUERIES)
         results += [("MEAS:VOLT?", v or "—"), ("MEAS:CURR?", c or "—"), ("MEAS:POW?", p or "—")]
-        inp = self.scpi_query("INPut:STATe?")
+        inp = self.scpi_query_cached("INPut:STATe?")
         results.append(("INPut:STATe?", inp or "—"))
         win = tk.Toplevel(self.master); win.title("Instrument Verification"); win.transient(self.master); win.grab_set()
         tree = ttk.Treeview(win, columns=("cmd","resp"), show="headings", height=8)
@@ -1647,28 +2549,59 @@ class HVBatteryDischargeApp:
             self.last_idn = idn or ""
             pass
 
+    def _set_status_widget(self, widget, **kw):
+        """Applies widget.config(**kw) only when it differs from the last values set, avoiding relayouts.
+
+        Used for every label refreshed per sample; such labels must not be configured directly.
+        """
+        if self._status_widget_cache.get(id(widget)) == kw: return
+        widget.config(**kw)
+        self._status_widget_cache[id(widget)] = kw
+
+    STATUS_POLL_ACTIVE_MS = 2000   # while a discharge is running
+    STATUS_POLL_IDLE_MS = 5000
+
+    def _editor_open(self) -> bool:
+        win = getattr(self, "edit_win", None)
+        try:
+            return bool(win is not None and win.winfo_exists())
+        except Exception:
+            return False
+
     def _status_poll_tick(self):
-        # Poll every ~2s for input state and function (real mode only)
+        # Poll input state and function (real mode only) every 5 s while idle, every 2 s while paused. During an
+        # active discharge the commanded state is shown instead, so the bus is left to the
+        # acquisition thread; nothing is queried while the modal profile editor holds the grab.
         try:
-            if self.test_mode.get() or not self.connected:
+            if self._editor_open():
+                pass
+            elif self._test_mode_cached or not self.connected:
                 # In test mode, reflect simulated state
-                self.input_state_badge.config(text="INP: TEST", bg="#f0ad4e", fg="white")
-                self.func_label.config(text=f"Mode: TEST")
+                self._set_status_widget(self.input_state_badge, text="INP: TEST", bg="#f0ad4e", fg="white")
+                self._set_status_widget(self.func_label, text="Mode: TEST")
+            elif self.running and not self.paused:
+                self._set_status_widget(self.input_state_badge, text="INP: ON", bg="#5cb85c", fg="white")
+                if self._last_known_func:
+                    self._set_status_widget(self.func_label, text=f"Mode: {self._last_known_func}")
             else:
-                st = self.scpi_query("INPut:STATe?")
+                st = self.scpi_query_cached("INPut:STATe?")
                 if st is not None:
                     on = (st.strip().upper() in ("1", "ON"))
-                    self.input_state_badge.config(text=f"INP: {'ON' if on else 'OFF'}",
-                                                  bg=("#5cb85c" if on else "#d9534f"),
-                                                  fg="white")
-                fn = self.scpi_query("INPut:FUNCtion?")
+                    self._set_status_widget(self.input_state_badge, text=f"INP: {'ON' if on else 'OFF'}",
+                                            bg=("#5cb85c" if on else "#d9534f"),
+                                            fg="white")
+                # The function only changes when we command it; query it once per connection
+                fn = self.scpi_query("INPut:FUNCtion?") if self._last_known_func is None else None
                 if fn is not None:
+                    raw = str(fn).strip()
                     try:
-                        n = int(str(fn).strip())
-                        name = FUNCTION_CODE_MAP.get(n, str(n))
-                    except Exception:
-                        name = str(fn).strip()
-                    self.func_label.config(text=f"Mode: {name}")
+                        n = int(raw)
+                        name = FUNCTION_CODE_MAP.get(n, raw)
+                    except ValueError:
+                        name = raw
+                    self._last_known_func = name
+                if self._last_known_func:
+                    self._set_status_widget(self.func_label, text=f"Mode: {self._last_known_func}")
         except Exception:
             pass
         # reschedule
@@ -1677,57 +2610,141 @@ class HVBatteryDischargeApp:
                 self.master.after_cancel(self._status_job)
         except Exception:
             pass
-        self._status_job = self.master.after(2000, self._status_poll_tick)
-
-        def _format_step_label(self, step: dict) -> str:
-            st = str(step.get("type", "CC")).upper()
-            val = float(step.get("value", 0.0))
-            stop_t = str(step.get("stop_condition_type", "voltage")).lower()
-            stop_v = float(step.get("stop_condition_value", 0.0))
-            unit = "A" if st == "CC" else ("W" if st == "CP" else "V")
-            stop_unit = "A" if stop_t == "current" else "V"
-            try:
-                return f"{st} {val:g}{unit} \u2192 {stop_v:g}{stop_unit}"
-            except Exception:
-                return f"{st} {val} -> {stop_v}"
+        delay = self.STATUS_POLL_ACTIVE_MS if self.running else self.STATUS_POLL_IDLE_MS   # active ticks are query-free
+        self._status_job = self.master.after(delay, self._status_poll_tick)
 
-    def update_plot(self):
-        """Updates the Matplotlib graph with Voltage and Power."""
-        self.ax_voltage.clear(); self.ax_power.clear()
-        self.ax_voltage.set_xlabel("Time (s)"); self.ax_voltage.set_ylabel("Voltage (V)", color="blue")
-        self.ax_power.set_ylabel("Power (W)", color="red")
-        self.ax_voltage.tick_params(axis='y', labelcolor='blue'); self.ax_power.tick_params(axis='y', labelcolor='red')
-        self.ax_voltage.grid(True, axis='y', linestyle=':')
-        if self.data_x:
-            line_v, = self.ax_voltage.plot(self.data_x, self.data_voltage, label="Voltage (V)", color="blue", lw=1.5)
-            line_p, = self.ax_power.plot(self.data_x, self.data_power, label="Power (W)", color="red", lw=1.5)
-            self.ax_voltage.legend(handles=[line_v, line_p], loc='upper right')
-            # Draw step markers
-            try:
-                ymin, ymax = self.ax_voltage.get_ylim()
-                ytext = ymax - (ymax - ymin) * 0.05
-                for tmark, label in getattr(self, "step_markers", []):
-                    self.ax_voltage.axvline(x=tmark, linestyle="--", linewidth=1, alpha=0.7)
-                    self.ax_voltage.text(tmark, ytext, label, rotation=90, va="top", ha="right", fontsize=8)
-            except Exception:
-                pass
+    def request_plot_update(self):
+        """Schedules one plot refresh for when Tk is idle; requests made before it runs coalesce."""
+        if self._plot_job is None:
+            self._plot_job = self.master.after_idle(self._run_plot_update)
+
+    def _run_plot_update(self):
+        self._plot_job = None
+        # Nothing to paint while the window is minimised / the graph is hidden: catch up on <Map>
         try:
-            self.fig.set_layout_engine('constrained')
-        except Exception:
-             self.fig.tight_layout()
-        # Apply manual limits if toggled off
+            if not self.canvas_widget.winfo_viewable():
+                self._plot_hidden_stale = True; return
+        except tk.TclError:
+            return
+        self.update_plot()
+
+    def _on_graph_mapped(self, event=None):
+        if self._plot_hidden_stale:
+            self._plot_hidden_stale = False
+            self._plot_bg = None   # one full render on return; per-tick blitting resumes after it
+            self.update_plot()
+
+    def update_plot(self, full: bool = False):
+        """Updates the Voltage/Power traces, blitting them unless the axes need a full redraw."""
+        n = len(self.samples)
+        t = self.samples.t
+        self.line_v.set_data(*self._decimated_for_display(t, self.samples.voltage))
+        self.line_p.set_data(*self._decimated_for_display(t, self.samples.power))
+        limits_changed = self._update_plot_limits(refit=full)
+        markers_changed = n and len(getattr(self, "step_markers", [])) != self._markers_drawn
+        self._plotted_n = n
+
+        if full or limits_changed or markers_changed or self._plot_bg is None:
+            self.plot_legend.set_visible(bool(n))
+            self._redraw_step_markers()
+            self._plot_bg = None     # stale until the pending render re-caches it
+            self.canvas.draw_idle()  # re-caches the background via _on_canvas_draw
+            return
+        self.canvas.restore_region(self._plot_bg)
+        self.ax_voltage.draw_artist(self.line_v)
+        self.ax_power.draw_artist(self.line_p)
+        self.canvas.blit(self.fig.bbox)
+
+    def _decimated_for_display(self, t: np.ndarray, y: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Min-max decimates a trace to about two points per pixel column of the axes.
+
+        The full-resolution data stays in the sample buffer and the database; only the
+        drawn view is thinned, keeping each column's extremes and the newest sample.
+        """
+        width_px = max(1, int(self.ax_voltage.bbox.width))
+        return _decimate(t, y, 2 * width_px)
+
+    def _on_canvas_draw(self, event=None):
+        """Caches the static background after each full render and paints the traces on top."""
+        self._plot_bg = self.canvas.copy_from_bbox(self.fig.bbox)
+        self.ax_voltage.draw_artist(self.line_v)
+        self.ax_power.draw_artist(self.line_p)
+
+    def _update_plot_limits(self, refit: bool = False) -> bool:
+        """Grows axis limits (with headroom) to cover new samples; returns True if any limit changed.
+
+        Only samples added since the last update are checked unless `refit` is set,
+        in which case limits are recomputed from all data (or the configured manual range).
+        """
+        def padded(lo, hi):
+            pad = max((hi - lo) * 0.1, abs(hi) * 0.01, 1.0)
+            return lo - pad, hi + pad
+
+        def fit(ax, series, auto, manual_key, start):
+            old = ax.get_ylim()
+            if not auto:
+                rng = self.config.get(manual_key, [None, None])
+                if isinstance(rng, (list, tuple)) and len(rng) == 2 and all(isinstance(x, (int, float)) for x in rng):
+                    new = (rng[0], rng[1])
+                else:
+                    new = old
+            else:
+                fresh = series[start:]
+                if not len(fresh):
+                    new = old if not refit else (0.0, 1.0)
+                elif refit:
+                    new = padded(float(fresh.min()), float(fresh.max()))
+                else:
+                    lo, hi = float(fresh.min()), float(fresh.max())
+                    new = old if (lo >= old[0] and hi <= old[1]) else padded(min(lo, old[0]), max(hi, old[1]))
+            if new != old:
+                ax.set_ylim(*new)
+                return True
+            return False
+
+        refit = refit or self._plotted_n == 0 or self._plotted_n > len(self.samples)
+        start = 0 if refit else self._plotted_n
+        changed = fit(self.ax_voltage, self.samples.voltage, getattr(self, "auto_v", None) is None or self.auto_v.get(),
+                      "voltage_ylim", start)
+        changed |= fit(self.ax_power, self.samples.power, getattr(self, "auto_p", None) is None or self.auto_p.get(),
+                       "power_ylim", start)
+
+        t = self.samples.t
+        t_end = float(t[-1]) if len(t) else 0.0
+        t_start = float(t[0]) if self.samples.dropped and len(t) else 0.0   # window slides once old samples are dropped
+        old_x = self.ax_voltage.get_xlim()
+        if refit or t_end > old_x[1] or old_x[0] != t_start:
+            new_x = (t_start, max(t_start + 10.0, t_end * 1.2))
+            if new_x != old_x:
+                self.ax_voltage.set_xlim(*new_x)
+                changed = True
+        return changed
+
+    def _redraw_step_markers(self):
+        """Syncs the step-change marker lines and labels with step_markers.
+
+        Artists are kept per marker: new markers get one line and label, markers that
+        went away (reset / new run) are removed, and existing ones are left alone. Labels
+        sit at 95% of the axes height (x in data, y in axes coordinates), so y-limit
+        changes never need to move them.
+        """
+        markers = getattr(self, "step_markers", []) if len(self.samples) else []
+        artists = self._marker_artists
         try:
-            if hasattr(self, "auto_v") and not self.auto_v.get():
-                v_rng = self.config.get("voltage_ylim", [None, None])
-                if isinstance(v_rng, (list, tuple)) and all(isinstance(x, (int, float)) for x in v_rng):
-                    self.ax_voltage.set_ylim(v_rng[0], v_rng[1])
-            if hasattr(self, "auto_p") and not self.auto_p.get():
-                p_rng = self.config.get("power_ylim", [None, None])
-                if isinstance(p_rng, (list, tuple)) and all(isinstance(x, (int, float)) for x in p_rng):
-                    self.ax_power.set_ylim(p_rng[0], p_rng[1])
+            wanted = set(markers)
+            for key in [k for k in artists if k not in wanted]:
+                for artist in artists.pop(key):
+                    artist.remove()
+            ax = self.ax_voltage
+            for marker in markers:
+                if marker in artists: continue
+                tmark, label = marker
+                artists[marker] = (ax.axvline(x=tmark, linestyle="--", linewidth=1, alpha=0.7),
+                                   ax.text(tmark, 0.95, label, transform=ax.get_xaxis_transform(),
+                                           rotation=90, va="top", ha="right", fontsize=8))
         except Exception:
             pass
-        self.canvas.draw()
+        self._markers_drawn = len(markers)
 
 
     def confirm_reset_data(self):
@@ -1741,217 +2758,119 @@ class HVBatteryDischargeApp:
         """Resets collected data and clears the graph."""
         logging.info("Resetting collected data.")
         self.energy_discharged = 0.0; self.start_time = None; self.last_time = None
-        self.data_x.clear(); self.data_voltage.clear(); self.data_current.clear(); self.data_power.clear()
+        self._energy_skip = []; self._energy_partial_kwh = 0.0; self._prev_sample_time = None
+        self.samples.clear()
         self.sim_voltage = self.config.get('test_mode_initial_voltage', 400.0)
         self.sim_current = 0.0; self.sim_power = 0.0; self.sim_cv_current = self.config.get('test_mode_cv_current_start', 5.0)
-        self.energy_label.config(text="0.000 kWh"); self.elapsed_time_label.config(text="00:00:00")
-        self.update_measurement_display(); self.update_plot()
+        self._set_status_widget(self.energy_label, text="0.000 kWh"); self._set_status_widget(self.elapsed_time_label, text="00:00:00")
+        if self._test_mode_cached: self.update_measurement_display(self.sim_voltage, self.sim_current, self.sim_power)
+        else: self.update_measurement_display(0.0, 0.0, 0.0)
+        self.update_plot(full=True)
+
+    def create_discharge_certificate(self, data_tuple: Optional[Tuple[np.ndarray, ...]] = None) -> Optional[Future]:
+        """Collects the report inputs and renders the PDF certificate in a worker process.
 
-    def create_discharge_certificate(self):
-        """Create the PDF report with plots, stats, and logos."""
-        """Generates a PDF certificate summarizing the discharge, with improved layout."""
+        `data_tuple` (t, V, I, P) skips re-reading the samples from the database; without it
+        they are loaded with get_discharge_data. Returns the render future (its result is the
+        PDF path), or None if there is nothing to report.
+        """
         if self.current_discharge_id == -1:
             logging.error("Invalid discharge ID, cannot generate report.")
             play_sound("error")
-            return
-        
-        data_tuple, summary_info = self.db_manager.get_discharge_data(self.current_discharge_id)
+            return None
 
-        if not summary_info or not data_tuple or not data_tuple[0]:
+        if data_tuple is not None and len(data_tuple[0]):
+            summary_info = self.db_manager.get_discharge_summary(self.current_discharge_id)
+        else:
+            data_tuple, summary_info = self.db_manager.get_discharge_data(self.current_discharge_id)
+
+        if not summary_info or not data_tuple or not len(data_tuple[0]):
             logging.warning("No data found in database for certificate generation.")
             play_sound("warning")
-            return
-            
-        db_data_x, db_voltage, db_current, db_power = data_tuple
+            return None
 
         mode_suffix = "_TEST" if summary_info.get('mode') == "Test" else ""
-        ts = summary_info['start_time'].strftime('%Y%m%d_%H%M%S')
+        ts = datetime.fromisoformat(summary_info['start_time']).strftime('%Y%m%d_%H%M%S')
         certificate_filename = self.report_dir / f"{summary_info['registration_number']}_discharge_{ts}{mode_suffix}.pdf"
         logging.info(f"Generating certificate: {certificate_filename}")
 
-        fig_report = None
-        pdf_object = None
+        certificate_logo = self._certificate_logo
+        logos = [(filename, img) for filename in self.config.get('logo_filenames', [])
+                 if (img := certificate_logo(filename)) is not None]
+
+        # Everything the renderer needs, as plain picklable data
+        job = {
+            "output_path": str(certificate_filename.resolve()),
+            "data": data_tuple,
+            "summary_info": summary_info,
+            "profile_name": self.current_profile_name,
+            "step_labels": [_format_step_label(step) for step in self.current_profile_data],
+            "step_timeline": [dict(row) for row in self.step_timeline],
+            "idn": self.last_idn,
+            "operator": self.operator_name,
+            "location": self.location_name,
+            "logos": logos,
+        }
+        return self._certificate_pool().submit(_render_certificate_worker, job)
+
+    def _certificate_pool(self) -> ProcessPoolExecutor:
+        """Returns the (lazily started) single-worker process pool used for PDF rendering."""
+        if self._cert_executor is None:
+            # spawn: a forked child would inherit the Tk interpreter and the open sockets
+            self._cert_executor = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"))
+        return self._cert_executor
+
+    def _watch_certificate(self, future: Future):
+        """Shows the pending report in the top bar and polls the render future from the Tk loop."""
+        self.report_status_label.config(text="Generating report…", fg="#333")
+        self.master.after(200, self._poll_cert_future, future)
+
+    def _poll_cert_future(self, future: Future):
+        if not future.done():
+            self.master.after(200, self._poll_cert_future, future); return
         try:
-            fig_report = plt.figure(figsize=(8.5, 11), dpi=150)
-            gs_main = fig_report.add_gridspec(2, 1, height_ratios=[5, 3.5], hspace=0.38)
-
-            ax_v_report = fig_report.add_subplot(gs_main[0])
-            ax_p_report = ax_v_report.twinx()
-
-            line_v_rep, = ax_v_report.plot(db_data_x, db_voltage, label="Voltage (V)", color="blue", lw=1.6)
-            line_p_rep, = ax_p_report.plot(db_data_x, db_power, label="Power (W)", color="red", lw=1.6)
-
-            ax_v_report.set_xlabel("Time (s)", fontsize=12)
-            ax_v_report.set_ylabel("Voltage (V)", color="blue", fontsize=12)
-            ax_p_report.set_ylabel("Power (W)", color="red", fontsize=12)
-            ax_v_report.tick_params(axis='y', labelcolor='blue', labelsize=11)
-            ax_p_report.tick_params(axis='y', labelcolor='red', labelsize=11)
-            ax_v_report.grid(True, linestyle=':', alpha=0.6)
-            report_title = f"HV Battery Discharge Report - {summary_info['registration_number']}" + (" (TEST MODE)" if summary_info.get('mode') == "Test" else "")
-            ax_v_report.set_title(report_title, fontsize=14, pad=14)
-
-            ax_v_report.legend(handles=[line_v_rep, line_p_rep], loc='upper right', fontsize='small', frameon=True)
-
-            ax_summary = fig_report.add_subplot(gs_main[1])
-            ax_summary.axis("off")
-            duration = db_data_x[-1] if db_data_x else 0
-            start_v = db_voltage[0] if db_voltage else 0
-            end_v = db_voltage[-1] if db_voltage else 0
-            duration_fmt = str(timedelta(seconds=int(duration)))
-            
-                        # Safe local formatter fallback in case method is missing
-            fmt_step = getattr(self, "_format_step_label", None)
-            if fmt_step is None:
-                def fmt_step(step):
-                    st = str(step.get("type", "CC")).upper()
-                    val = step.get("value", 0.0)
-                    stop_t = str(step.get("stop_condition_type", "voltage")).lower()
-                    stop_v = step.get("stop_condition_value", 0.0)
-                    unit = "A" if st == "CC" else ("W" if st == "CP" else "V")
-                    stop_unit = "A" if stop_t == "current" else "V"
-                    try:
-                        val = float(val); stop_v = float(stop_v)
-                    except Exception:
-                        pass
-                    return f"{st} {val:g}{unit} -> {stop_v:g}{stop_unit}"
-            profile_details_str = f"Profile: {self.current_profile_name}\nSteps:\n"
-            if self.current_profile_data:
-                for i, step in enumerate(self.current_profile_data):
-                    profile_details_str += f"  {i+1}) {fmt_step(step)}\n"
-            else:
-                profile_details_str += "  (No steps defined)\n"
-            comment_str = f"\nComments: {summary_info.get('discharge_comment', '')}" if summary_info.get('discharge_comment') else ""
-            
-
-            # Compute basic stats
-            try:
-                v_min = min(db_voltage) if db_voltage else 0.0
-                v_max = max(db_voltage) if db_voltage else 0.0
-                v_avg = (sum(db_voltage)/len(db_voltage)) if db_voltage else 0.0
-                p_min = min(db_power) if db_power else 0.0
-                p_max = max(db_power) if db_power else 0.0
-                p_avg = (sum(db_power)/len(db_power)) if db_power else 0.0
-                i_min = min(db_current) if db_current else 0.0
-                i_max = max(db_current) if db_current else 0.0
-                i_avg = (sum(db_current)/len(db_current)) if db_current else 0.0
-            except Exception:
-                v_min=v_max=v_avg=p_min=p_max=p_avg=i_min=i_max=i_avg=0.0
-
-            idn_line = self.last_idn or "(no IDN)"
-            summary_text = (
-                "Registration Number: " + summary_info['registration_number'] + "\n"
-                "Date: " + summary_info['start_time'].strftime('%Y-%m-%d %H:%M:%S') + "\n"
-                "Mode: " + str(summary_info.get('mode', 'N/A')) + "\n"
-                "Instrument: " + idn_line + "\n"                "Operator: " + (self.operator_name or "-") + "\n"                "Location: " + (self.location_name or "-") + "\n\n"
-                + profile_details_str + "\n"
-                f"Starting Voltage: {start_v:.2f} V\nEnding Voltage: {end_v:.2f} V\n"
-                f"Total Discharge Duration: {duration_fmt} ({duration:.2f} s)\n"
-                f"Total Energy Discharged: {summary_info.get('total_energy_discharged', 0.0):.3f} kWh{comment_str}\n\n"
-                f"Stats (V): min {v_min:.2f}, avg {v_avg:.2f}, max {v_max:.2f}\n"
-                f"Stats (A): min {i_min:.2f}, avg {i_avg:.2f}, max {i_max:.2f}\n"
-                f"Stats (W): min {p_min:.2f}, avg {p_avg:.2f}, max {p_max:.2f}"
-            )
-            
-            # Append step timeline table
-            try:
-                if self.step_timeline:
-                    def _fmt(t):
-                        t = int(max(0, t or 0)); h = t // 3600; m = (t % 3600) // 60; s = t % 60
-                        return f"{h:02d}:{m:02d}:{s:02d}"
-                    rows = []
-                    for row in self.step_timeline:
-                        s = row.get("start_s", 0.0)
-                        e = row.get("end_s", s)
-                        d = max(0.0, (e or 0.0) - (s or 0.0))
-                        idx = row.get("idx", "?")
-                        label = row.get("label", "")
-                        rows.append(f"{idx:>2}) {_fmt(s)} → {_fmt(e)}  (Δ {_fmt(d)})  — {label}")
-                    if rows:
-                        summary_text += "\n\nStep timeline:\n" + "\n".join(rows)
-            except Exception:
-                pass
-
-            ax_summary.text(0.03, 0.97, summary_text, fontsize=9.7, va="top", ha="left", linespacing=1.44, wrap=True)
-
-            logo_files = self.config.get('logo_filenames', [])
-            valid_logos = []; logo_aspects = []
-            for filename in logo_files:
-               logo_path = self.logo_dir / filename
-               if logo_path.is_file():
-                   try:
-                       img = Image.open(logo_path)
-                       # Normalize palette+transparency and flatten onto white
-                       if (img.mode == "P" and "transparency" in getattr(img, "info", {})) or img.mode in ("RGBA", "LA"):
-                           img = img.convert("RGBA")
-                           _bg = Image.new("RGBA", img.size, (255, 255, 255, 255))
-                           img = Image.alpha_composite(_bg, img).convert("RGB")
-                       valid_logos.append(img)
-                       logo_aspects.append(img.width / img.height if img.height > 0 else 1)
-                   except Exception as e:
-                       logging.warning(f"Logo load error: {e}")
-
-            if valid_logos:
-                num_logos = len(valid_logos)
-                logo_area_bottom = 0.015; logo_area_height = 0.07
-                logo_area_left = 0.12; logo_area_width = 0.76
-                total_logo_width_fig = sum(logo_area_height * aspect for aspect in logo_aspects)
-                min_spacing_fig = 0.014
-                total_spacing_fig = min_spacing_fig * (num_logos - 1) if num_logos > 1 else 0
-                required_width_fig = total_logo_width_fig + total_spacing_fig
-                scale_factor = 1.0
-                if required_width_fig > logo_area_width:
-                    scale_factor = logo_area_width / required_width_fig
-                    total_spacing_fig = min_spacing_fig * (num_logos - 1) * scale_factor if num_logos > 1 else 0
-                    required_width_fig = (total_logo_width_fig * scale_factor) + total_spacing_fig
-                start_x_fig = logo_area_left + (logo_area_width - required_width_fig) / 2
-                current_x_fig = max(logo_area_left, start_x_fig)
-                for i, img in enumerate(valid_logos):
-                    logo_height_fig_scaled = logo_area_height * scale_factor
-                    logo_width_fig_scaled = logo_height_fig_scaled * logo_aspects[i]
-                    logo_bottom_fig = logo_area_bottom
-                    if current_x_fig + logo_width_fig_scaled <= logo_area_left + logo_area_width + 0.01:
-                        img_ax = fig_report.add_axes([current_x_fig, logo_bottom_fig, logo_width_fig_scaled, logo_height_fig_scaled])
-                        img_ax.imshow(img); img_ax.axis("off")
-                        current_x_fig += logo_width_fig_scaled + (min_spacing_fig * scale_factor)
-                    else:
-                        logging.warning(f"Could not fit logo '{logo_files[i]}' in certificate space."); break
-
-            fig_report.subplots_adjust(left=0.10, right=0.92, top=0.95, bottom=0.20, hspace=0.39)
-            ax_p_report.set_ylabel("Power (W)", color="red", fontsize=12, labelpad=18)
-
-            pdf_object = PdfPages(certificate_filename)
-            pdf_object.savefig(fig_report)
-            logging.info(f"Successfully generated certificate: {certificate_filename}")
-
+            path = future.result()
         except Exception as e:
-            logging.error(f"Error generating PDF certificate: {e}", exc_info=True)
+            logging.error(f"Failed certificate generation: {e}", exc_info=True)
+            self.report_status_label.config(text="Report failed", fg="red")
             play_sound("error")
-            raise RuntimeError(f"Error during PDF generation: {e}") from e
-        finally:
-            if pdf_object is not None:
-                try: pdf_object.close(); logging.debug("PdfPages object closed.")
-                except Exception as pdf_close_e: logging.error(f"Error closing PdfPages object: {pdf_close_e}")
-            if fig_report is not None and plt.fignum_exists(fig_report.number):
-                plt.close(fig_report); logging.debug("Figure closed.")
+            messagebox.showerror("Report Error", f"Stopped, but failed PDF generation.\nError: {e}", parent=self.master)
+            return
+        logging.info(f"Successfully generated certificate: {path}")
+        self.report_status_label.config(text=f"Saved {Path(path).name}", fg="green")
+        play_sound("success")
+        messagebox.showinfo("Discharge Stopped", "Discharge stopped. Certificate saved.", parent=self.master)
 
     def on_closing(self):
         """Handles window closing event."""
         logging.info("Close button clicked.")
+        self._flush_profiles()
         if self.running:
             if messagebox.askyesno("Discharge Running", "Stop discharge and exit?", parent=self.master):
                 logging.info("Stopping discharge due to window close.")
                 self.stop_discharge(generate_report=True)
-                if not self.test_mode.get():
+                if not self._test_mode_cached:
                     self.disconnect_instrument()
+                self._shutdown_certificate_pool()
+                self.db_manager.close()
                 self.master.destroy()
             else:
                 logging.info("Window close cancelled.")
                 return
         else:
-            if not self.test_mode.get():
+            if not self._test_mode_cached:
                 self.disconnect_instrument()
+            self._shutdown_certificate_pool()
+            self.db_manager.close()
             self.master.destroy()
 
+    def _shutdown_certificate_pool(self):
+        """Waits for a certificate still being rendered, then stops the worker process."""
+        if self._cert_executor is not None:
+            logging.info("Waiting for certificate rendering to finish...")
+            self._cert_executor.shutdown(wait=True)
+            self._cert_executor = None
+
 
 # --- Run Application ---
 if __name__ == "__main__":